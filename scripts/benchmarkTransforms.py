@@ -0,0 +1,249 @@
+"""
+    Benchmarks the record-to-JSON transforms used by the generator scripts, without touching the network. Synthetic
+    bucket rows are rebuilt from the checked-in cdn/json data files, then repeated at each scale (1x, 10x and 100x by
+    default) with unique IDs and page names, so that every copy goes through the same code paths as the real data.
+
+    For each transform, reports the rows processed per second (best of --repeat runs) and the peak memory allocated
+    while running it. Results can be saved with --output, and compared against a previous run with --baseline, which
+    exits with a non-zero status if any transform got slower or hungrier than --tolerance allows.
+
+    Usage: python benchmarkTransforms.py [--scales 1 10 100] [--output FILE] [--baseline FILE]
+
+    Written for Python 3.9.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import generateEquipment
+import generateEquipmentAliases
+import generateMonsters
+import metrics
+
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+
+# IDs of each copy of the data are offset by this much, so that copies don't get deduplicated against each other
+ID_STRIDE = 1000000
+
+
+def equipment_row(e):
+    """Rebuilds the infobox_item bucket row that an equipment.json entry was generated from."""
+    row = {
+        'page_name': e['name'],
+        'page_name_sub': e['name'] + ('#' + e['version'] if e['version'] else ''),
+        'item_id': [str(e['id'])],
+        'weight': e.get('weight', 0),
+        'version_anchor': e['version'],
+        'image': ['File:' + e['image']] if e['image'] else [],
+        'infobox_bonuses.equipment_slot': '2h' if e['isTwoHanded'] else e['slot'],
+        'infobox_bonuses.weapon_attack_speed': e['speed'],
+        'infobox_bonuses.combat_style': e['category'],
+        'infobox_bonuses.strength_bonus': e['bonuses']['str'],
+        'infobox_bonuses.ranged_strength_bonus': e['bonuses']['ranged_str'],
+        'infobox_bonuses.magic_damage_bonus': (e['bonuses']['magic_str'] or 0) / 10,
+        'infobox_bonuses.prayer_bonus': e['bonuses']['prayer'],
+    }
+    for k, field in [('stab', 'stab_attack_bonus'), ('slash', 'slash_attack_bonus'), ('crush', 'crush_attack_bonus'),
+                     ('magic', 'magic_attack_bonus'), ('ranged', 'range_attack_bonus')]:
+        row['infobox_bonuses.' + field] = e['offensive'][k]
+    for k, field in [('stab', 'stab_defence_bonus'), ('slash', 'slash_defence_bonus'),
+                     ('crush', 'crush_defence_bonus'), ('magic', 'magic_defence_bonus'),
+                     ('ranged', 'range_defence_bonus')]:
+        row['infobox_bonuses.' + field] = e['defensive'][k]
+    return row
+
+
+def monster_row(m):
+    """Rebuilds the infobox_monster bucket row that a monsters.json entry was generated from."""
+    row = {
+        'page_name': m['name'],
+        'page_name_sub': m['name'] + ('#' + m['version'] if m['version'] else ''),
+        'name': m['name'],
+        'id': [str(m['id'])],
+        'image': ['File:' + m['image']] if m['image'] else [],
+        'combat_level': m['level'],
+        'attack_speed': m['speed'],
+        'attack_style': m['style'],
+        'size': m['size'],
+        'max_hit': [m['max_hit']],
+        'attack_level': m['skills']['atk'],
+        'defence_level': m['skills']['def'],
+        'hitpoints': m['skills']['hp'],
+        'magic_level': m['skills']['magic'],
+        'ranged_level': m['skills']['ranged'],
+        'strength_level': m['skills']['str'],
+        'attack_bonus': m['offensive']['atk'],
+        'magic_attack_bonus': m['offensive']['magic'],
+        'magic_damage_bonus': m['offensive']['magic_str'],
+        'range_attack_bonus': m['offensive']['ranged'],
+        'range_strength_bonus': m['offensive']['ranged_str'],
+        'strength_bonus': m['offensive']['str'],
+        'flat_armour': m['defensive']['flat_armour'],
+        'crush_defence_bonus': m['defensive']['crush'],
+        'magic_defence_bonus': m['defensive']['magic'],
+        'heavy_range_defence_bonus': m['defensive']['heavy'],
+        'standard_range_defence_bonus': m['defensive']['standard'],
+        'light_range_defence_bonus': m['defensive']['light'],
+        'slash_defence_bonus': m['defensive']['slash'],
+        'stab_defence_bonus': m['defensive']['stab'],
+        'attribute': m['attributes'],
+        'burn_immune': (m.get('immunities') or {}).get('burn'),
+    }
+    if m['is_slayer_monster']:
+        row['slayer_experience'] = 1
+    if m.get('weakness'):
+        row['elemental_weakness'] = m['weakness']['element']
+        row['elemental_weakness_percent'] = m['weakness']['severity']
+    return row
+
+
+def scale_rows(rows, scale, id_field):
+    """Repeats the rows `scale` times, giving each copy its own IDs and page_name_subs."""
+    scaled = []
+    for copy in range(scale):
+        for row in rows:
+            if copy:
+                row = dict(row)
+                name, sep, version = row['page_name_sub'].partition('#')
+                row['page_name_sub'] = f'{name} ({copy}){sep}{version}'
+                row[id_field] = [str(int(row[id_field][0]) + copy * ID_STRIDE)]
+            scaled.append(row)
+    scaled.sort(key=lambda r: r['page_name_sub'])
+    return scaled
+
+
+def load_rows():
+    with open(generateEquipment.FILE_NAME, 'r') as f:
+        equipment = json.load(f)
+    with open(generateMonsters.FILE_NAME, 'r') as f:
+        monsters = json.load(f)
+
+    # Manual entries are merged in after the transform, so they don't have a bucket row to rebuild
+    return (
+        [equipment_row(e) for e in equipment if e['id'] is not None and e['id'] > 0],
+        [monster_row(m) for m in monsters if m['id'] is not None and m['id'] > 0],
+    )
+
+
+def run_aliases(rows):
+    all_items = generateEquipmentAliases.build_alias_items(rows)
+    dispatcher = generateEquipmentAliases.AliasRuleDispatcher(generateEquipmentAliases.ALIAS_RULES)
+    aliases = generateEquipmentAliases.build_aliases(all_items, dispatcher)
+    return generateEquipmentAliases.render_aliases(aliases)
+
+
+# Each benchmark is (name, input, function), where input is 'equipment' or 'monsters'
+BENCHMARKS = [
+    ('equipment', 'equipment', lambda rows: generateEquipment.build_equipment(rows, [])),
+    ('field_extractor', 'monsters', lambda rows: [generateMonsters.field_extractor.extract(v) for v in rows]),
+    ('monsters', 'monsters', lambda rows: generateMonsters.build_monsters(rows, [])),
+    ('monsters_parallel', 'monsters', lambda rows: generateMonsters.build_monsters(rows, [], os.cpu_count())),
+    ('aliases', 'equipment', run_aliases),
+]
+
+
+def measure(fn, rows, repeat):
+    """Returns the best wall time over `repeat` runs, and the peak memory allocated during a separate traced run."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Tracing slows everything down, so memory is measured on its own run
+    tracemalloc.start()
+    try:
+        fn(rows)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def run(scales, repeat):
+    equipment_rows, monster_rows = load_rows()
+    results = []
+    for scale in scales:
+        inputs = {
+            'equipment': scale_rows(equipment_rows, scale, 'item_id'),
+            'monsters': scale_rows(monster_rows, scale, 'id'),
+        }
+        for name, input_name, fn in BENCHMARKS:
+            rows = inputs[input_name]
+            elapsed, peak = measure(fn, rows, repeat)
+            result = {
+                'name': name,
+                'scale': scale,
+                'rows': len(rows),
+                'seconds': round(elapsed, 4),
+                'rows_per_second': round(len(rows) / elapsed) if elapsed else None,
+                'peak_memory_bytes': peak,
+            }
+            results.append(result)
+            print(f"{name:<18} {scale:>4}x {result['rows']:>9} rows  {elapsed:>8.3f}s  "
+                  f"{result['rows_per_second'] or 0:>10} rows/s  {peak / 1024 / 1024:>8.1f} MiB peak")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints any results that regressed against the baseline by more than the tolerance, returning how many did."""
+    previous = {(r['name'], r['scale']): r for r in baseline['results']}
+    regressions = 0
+    for r in results:
+        before = previous.get((r['name'], r['scale']))
+        if before is None:
+            continue
+
+        if before['rows_per_second'] and r['rows_per_second'] < before['rows_per_second'] * (1 - tolerance):
+            print(f"[WARN] {r['name']} at {r['scale']}x slowed down: "
+                  f"{before['rows_per_second']} -> {r['rows_per_second']} rows/s")
+            regressions += 1
+        if r['peak_memory_bytes'] > before['peak_memory_bytes'] * (1 + tolerance):
+            print(f"[WARN] {r['name']} at {r['scale']}x uses more memory: "
+                  f"{before['peak_memory_bytes']} -> {r['peak_memory_bytes']} bytes")
+            regressions += 1
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='how many copies of the checked-in data to feed each transform')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of timed runs per transform, the fastest of which is reported')
+    parser.add_argument('--output', metavar='FILE', default=None,
+                        help='write the results to this file as JSON')
+    parser.add_argument('--baseline', metavar='FILE', default=None,
+                        help='compare against results previously written with --output')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed fractional drop in throughput or growth in peak memory against the baseline')
+    args = parser.parse_args()
+
+    # Don't print a line for every row processed
+    metrics.quiet = True
+
+    results = run(args.scales, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            print('Saving benchmark results at file: ' + args.output)
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print('Total regressions: ' + str(regressions))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
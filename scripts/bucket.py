@@ -0,0 +1,167 @@
+"""
+    Client for the wiki's Bucket API (https://meta.weirdgloop.org/w/Extension:Bucket), used by the generator scripts
+    to pull infobox data. Bucket doesn't say when there are more results, so we page through with limit/offset until
+    a page comes back short.
+
+    Written for Python 3.9.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import metrics
+import wiki
+
+PAGE_SIZE = 500
+
+# How many pages the generator scripts keep in flight at once by default
+DEFAULT_PREFETCH = 4
+
+
+class BucketError(Exception):
+    """The Bucket API returned an error (including a maxlag error that outlasted the retries) instead of results."""
+
+
+class Raw(str):
+    """A Bucket expression that is passed through to the query unquoted, such as bucket.Null()."""
+
+
+NULL = Raw('bucket.Null()')
+
+
+def Not(*args: Any) -> Raw:
+    return Raw(f'bucket.Not({_format_args(args)})')
+
+
+Condition = Sequence[Any]
+Join = Tuple[str, str, str]
+Order = Tuple[str, str]
+
+
+def _format_arg(value: Any) -> str:
+    if isinstance(value, Raw):
+        return str(value)
+    if isinstance(value, str):
+        return repr(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _format_args(args: Sequence[Any]) -> str:
+    return ', '.join(_format_arg(a) for a in args)
+
+
+def build_query(
+        bucket: str,
+        fields: Sequence[str],
+        where: Sequence[Condition] = (),
+        join: Union[Join, Sequence[Join], None] = None,
+        order: Optional[Order] = None,
+        limit: int = PAGE_SIZE,
+        offset: int = 0,
+) -> str:
+    """Builds the Lua query string for a single page of a Bucket query."""
+    if join and isinstance(join[0], str):
+        join = [join]
+
+    query = f"bucket({bucket!r}).select({_format_args(fields)}).limit({limit}).offset({offset})"
+    for cond in where:
+        query += f".where({_format_args(cond)})"
+    for j in join or []:
+        query += f".join({_format_args(j)})"
+    if order:
+        query += f".orderBy({_format_args(order)})"
+    return query + '.run()'
+
+
+def fetch_page(query: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Runs a single Bucket query, returning its rows, or None if the API returned no results. Raises BucketError if the
+    API returned an error, as treating that as the end of the results would silently truncate the table.
+    """
+    r = wiki.get(wiki.API_BASE, params={
+        'action': 'bucket',
+        'format': 'json',
+        'query': query,
+    })
+    r.raise_for_status()
+    data = r.json()
+
+    if 'error' in data:
+        raise BucketError(f"Bucket API error: {data['error']}")
+    if 'bucket' not in data:
+        # No results?
+        return None
+    return data['bucket']
+
+
+def query(
+        bucket: str,
+        fields: Sequence[str],
+        where: Sequence[Condition] = (),
+        join: Union[Join, Sequence[Join], None] = None,
+        order: Optional[Order] = None,
+        prefetch: int = 1,
+        offset: int = 0,
+        on_page: Optional[Callable[[int, List[Dict[str, Any]]], None]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every row matching the query, paging through the results PAGE_SIZE rows at a time. Rows are yielded as
+    each page arrives, so callers can start transforming before the whole table has been fetched.
+
+    With prefetch > 1, that many pages are requested concurrently ahead of the one being consumed. Pages are still
+    yielded in offset order, and any outstanding requests are dropped once a short page marks the end of the results.
+
+    Paging starts from `offset`. If on_page is given, it is called with each page's offset and rows just before they
+    are yielded.
+
+    Example:
+        for row in bucket.query('infobox_item', ['page_name', 'item_id'],
+                                where=[('item_id', '!=', bucket.NULL)],
+                                order=('page_name_sub', 'asc')):
+            ...
+    """
+    def fetch(offset):
+        metrics.log(f'Fetching {bucket} info: {offset}')
+        return fetch_page(build_query(bucket, fields, where, join, order, PAGE_SIZE, offset))
+
+    def emit(page_offset, page):
+        if on_page is not None:
+            on_page(page_offset, page)
+        return page
+
+    if prefetch <= 1:
+        while True:
+            page = fetch(offset)
+            if page is None:
+                return
+
+            yield from emit(offset, page)
+
+            if len(page) == PAGE_SIZE:
+                offset += PAGE_SIZE
+            else:
+                # If we are at the end of the results, stop here
+                return
+
+    executor = ThreadPoolExecutor(max_workers=prefetch)
+    page_offsets = [offset + i * PAGE_SIZE for i in range(prefetch)]
+    in_flight = deque((page_offset, executor.submit(fetch, page_offset)) for page_offset in page_offsets)
+    next_offset = offset + prefetch * PAGE_SIZE
+    try:
+        while in_flight:
+            page_offset, future = in_flight.popleft()
+            page = future.result()
+            if page is None or len(page) < PAGE_SIZE:
+                # This is the last page, so anything speculatively requested after it is past the end
+                if page:
+                    yield from emit(page_offset, page)
+                return
+
+            # Keep the window full before handing rows to the caller
+            in_flight.append((next_offset, executor.submit(fetch, next_offset)))
+            next_offset += PAGE_SIZE
+            yield from emit(page_offset, page)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,157 @@
+"""
+    On-disk HTTP response cache for wiki requests. Response bodies are stored content-addressed under objects/ by their
+    SHA-256, and an index entry keyed by the request URL records the body hash along with the ETag and Last-Modified
+    validators, so that stale entries can be revalidated with a conditional request instead of re-downloaded.
+
+    A body is left behind whenever a URL's content changes, so `prune` clears out entries that haven't been used in
+    max_age seconds, along with any bodies no entry refers to any more.
+
+    Written for Python 3.9.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def tmp_path_for(path):
+    """A temporary path next to path, unique to the calling thread, so that concurrent writers don't collide."""
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+@contextlib.contextmanager
+def open_atomic(path, mode='w'):
+    """
+    Opens a temporary file next to path for writing, which replaces path once the block completes. If the block
+    fails, the temporary file is removed instead, so path is never left half-written.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = tmp_path_for(path)
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_atomic(path, data):
+    with open_atomic(path, 'wb') as f:
+        f.write(data)
+
+
+class ResponseCache:
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _entry_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, 'index', key[:2], key + '.json')
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.path, 'objects', content_hash[:2], content_hash)
+
+    def lookup(self, url):
+        """Returns the index entry for a URL, or None if it isn't cached (or its body has gone missing)."""
+        try:
+            with open(self._entry_path(url), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.isfile(self._object_path(entry['content_hash'])):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, r):
+        """Caches a successful response, returning its new index entry."""
+        content_hash = hashlib.sha256(r.content).hexdigest()
+        object_path = self._object_path(content_hash)
+        if not os.path.isfile(object_path):
+            write_atomic(object_path, r.content)
+
+        entry = {
+            'url': url,
+            'content_hash': content_hash,
+            'content_type': r.headers.get('Content-Type'),
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        write_atomic(self._entry_path(url), json.dumps(entry).encode('utf-8'))
+        return entry
+
+    def touch(self, entry):
+        """Marks an entry as fresh again, after the server confirmed it is unchanged."""
+        entry['fetched_at'] = time.time()
+        write_atomic(self._entry_path(entry['url']), json.dumps(entry).encode('utf-8'))
+
+    def response(self, entry):
+        """Builds a requests.Response from a cached entry, so callers don't need to care where it came from."""
+        with open(self._object_path(entry['content_hash']), 'rb') as f:
+            content = f.read()
+
+        r = requests.Response()
+        r.status_code = 200
+        r.url = entry['url']
+        r._content = content
+        if entry.get('content_type'):
+            r.headers['Content-Type'] = entry['content_type']
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        return r
+
+    def _walk(self, subdir):
+        for root, _, files in os.walk(os.path.join(self.path, subdir)):
+            for file in files:
+                yield os.path.join(root, file)
+
+    def prune(self, max_age=DEFAULT_MAX_AGE):
+        """
+        Removes the entries that haven't been fetched or revalidated in max_age seconds, and every body that isn't
+        referred to by a remaining entry. Returns how many entries and bodies were removed, and the bytes freed.
+        """
+        now = time.time()
+        referenced = set()
+        removed_entries = 0
+        for path in self._walk('index'):
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+
+            if entry is None or now - entry['fetched_at'] >= max_age:
+                os.remove(path)
+                removed_entries += 1
+            else:
+                referenced.add(entry['content_hash'])
+
+        removed_objects = 0
+        freed = 0
+        for path in self._walk('objects'):
+            if os.path.basename(path) not in referenced:
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed_objects += 1
+        return removed_entries, removed_objects, freed
@@ -0,0 +1,152 @@
+"""
+    Change detection for the generated JSON data files. Before writing a file, the generators compare the new records
+    against the ones already on disk: if the canonical content hash is the same the file is left alone (so downstream
+    builds and CDN caches aren't invalidated), otherwise it is written along with a changelog listing the records that
+    were added, removed or changed.
+
+    Records are matched up by their (id, version). Where that isn't unique, records are matched in the order they
+    appear in the file.
+
+    The new records and the file on disk are both streamed through (see jsonstream.py), keeping only a digest of each
+    record in memory. The changed records are read back from the two files to list their changed fields.
+
+    Written for Python 3.9.
+"""
+import hashlib
+import json
+import os
+import time
+
+import cache
+import jsonstream
+
+
+def keyed(records):
+    """Yields ((id, version, n), record) for each record, where n counts earlier records with the same id/version."""
+    seen = {}
+    for r in records:
+        key = (r.get('id'), r.get('version'))
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        yield key + (n,), r
+
+
+def changed_fields(old, new, prefix=''):
+    """Lists the (dotted) key paths whose values differ between two records."""
+    fields = []
+    for k in list(old) + [k for k in new if k not in old]:
+        path = prefix + k
+        a, b = old.get(k), new.get(k)
+        if isinstance(a, dict) and isinstance(b, dict):
+            fields.extend(changed_fields(a, b, path + '.'))
+        elif k not in old or k not in new or a != b:
+            fields.append(path)
+    return fields
+
+
+class Summary:
+    """
+    Summarises a stream of records as they're added: the canonical hash of the whole list (one that doesn't depend on
+    key order or whitespace), and the digest and name of each record by its key.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256(b'[')
+        self._seen = {}
+        self.records = {}
+
+    def add(self, record):
+        data = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        if self.records:
+            self._hash.update(b',')
+        self._hash.update(data)
+
+        key = (record.get('id'), record.get('version'))
+        n = self._seen.get(key, 0)
+        self._seen[key] = n + 1
+        self.records[key + (n,)] = (hashlib.sha256(data).digest(), record.get('name'))
+        return record
+
+    def hexdigest(self):
+        h = self._hash.copy()
+        h.update(b']')
+        return h.hexdigest()
+
+
+def summarise(path):
+    """Summarises the records previously written to a file, or returns None if there aren't any."""
+    summary = Summary()
+    try:
+        for r in jsonstream.load(path):
+            summary.add(r)
+    except (OSError, ValueError):
+        return None
+    return summary
+
+
+def _describe(key, name):
+    return {'id': key[0], 'version': key[1], 'name': name}
+
+
+def diff(old, new, old_path, new_path):
+    """Returns the records added, removed and changed between the summaries of two files."""
+    added = [_describe(k, name) for k, (_, name) in new.records.items() if k not in old.records]
+    removed = [_describe(k, name) for k, (_, name) in old.records.items() if k not in new.records]
+
+    changed_keys = [k for k, (digest, _) in new.records.items() if k in old.records and old.records[k][0] != digest]
+    changed = []
+    if changed_keys:
+        wanted = set(changed_keys)
+        old_records = {k: r for k, r in keyed(jsonstream.load(old_path)) if k in wanted}
+        new_records = {k: r for k, r in keyed(jsonstream.load(new_path)) if k in wanted}
+        for k in changed_keys:
+            changed.append(dict(_describe(k, new.records[k][1]), fields=changed_fields(old_records[k], new_records[k])))
+
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+
+def write_if_changed(path, records, changelog_path):
+    """
+    Writes the records (any iterable, in the order they should be saved) to path as JSON, unless the file already
+    holds the same content. When the file is written, a changelog against its previous content is written to
+    changelog_path. Returns whether the file was written, and how many records there were.
+    """
+    # The records can only be streamed through once, so write them out before knowing whether they've changed
+    tmp_path = cache.tmp_path_for(path)
+    new = Summary()
+    try:
+        with open(tmp_path, 'w') as f:
+            count = jsonstream.dump((new.add(r) for r in records), f)
+
+        new_hash = new.hexdigest()
+        old = summarise(path)
+        old_hash = old.hexdigest() if old is not None else None
+
+        if new_hash == old_hash:
+            print('No changes to JSON at file: ' + path)
+            return False, count
+
+        changes = diff(old or Summary(), new, path, tmp_path)
+
+        print('Saving to JSON at file: ' + path)
+        os.replace(tmp_path, path)
+    finally:
+        # Never leave the temporary file behind next to the data file, where it would be committed along with it
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with cache.open_atomic(changelog_path) as f:
+        print('Saving changelog at file: ' + changelog_path)
+        json.dump({
+            'file': os.path.basename(path),
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'previous_hash': old_hash,
+            'hash': new_hash,
+            'added': changes['added'],
+            'removed': changes['removed'],
+            'changed': changes['changed'],
+        }, f, ensure_ascii=False, indent=2)
+
+    print(f"Records added: {len(changes['added'])}, removed: {len(changes['removed'])}, "
+          f"changed: {len(changes['changed'])}")
+    return True, count
@@ -0,0 +1,122 @@
+"""
+    Checkpoint journal for resumable generator runs. As a run progresses it appends a JSON line to the journal for
+    each bucket page fetched, once the JSON files have been written, and for each image downloaded. If the run fails,
+    running the script again with --resume replays the journal: pages already fetched aren't fetched again, the query
+    carries on from the next offset, the JSON files aren't rewritten if they already were, and images already
+    downloaded are skipped. A run that gets to the end removes its journal.
+
+    Only the offsets of the journaled pages are kept in memory; their rows are read back from the journal when replayed.
+
+    A journal line cut short by a crash is ignored, so at worst the step it was recording is redone.
+
+    Written for Python 3.9.
+"""
+import json
+import os
+import threading
+
+DEFAULT_DIR = '.checkpoint'
+
+
+def add_arguments(parser):
+    parser.add_argument('--resume', action='store_true',
+                        help='carry on from where the last run stopped, using its checkpoint journal')
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_DIR,
+                        help='directory to keep checkpoint journals in')
+
+
+class Journal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        # (offset, number of rows) of each page in the journal
+        self.pages = []
+        self.pages_done = False
+        self.written = None
+        self.images = {}
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        if resume and os.path.isfile(path):
+            # Copy whatever can be loaded into a fresh journal, so that a torn final line doesn't end up in the middle
+            old_path = path + '.old'
+            os.replace(path, old_path)
+            self._f = open(path, 'w')
+            self._load(old_path)
+            os.remove(old_path)
+        else:
+            self._f = open(path, 'w')
+
+        if resume:
+            print(f'Resuming from checkpoint at file: {path} ({len(self.pages)} pages, '
+                  f"{'written, ' if self.written is not None else ''}{len(self.images)} images)")
+
+    def _load(self, path):
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if 'page' in entry:
+                    self.pages.append((entry['page'], len(entry['rows'])))
+                elif 'pages_done' in entry:
+                    self.pages_done = True
+                elif 'written' in entry:
+                    self.written = entry['written']
+                elif 'image' in entry:
+                    self.images[entry['image']] = entry['entry']
+                self._f.write(line)
+        self._f.flush()
+
+    def _append(self, entry):
+        self._f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._f.flush()
+
+    def _journaled_rows(self):
+        remaining = len(self.pages)
+        with open(self.path, 'r') as f:
+            for line in f:
+                if not remaining:
+                    return
+                entry = json.loads(line)
+                if 'page' in entry:
+                    remaining -= 1
+                    yield from entry['rows']
+
+    def query(self, start_query):
+        """
+        Yields the rows of every page in the journal, then carries on with start_query(offset, on_page), which should
+        return a bucket.query for the rows from that offset that calls on_page with each page it fetches.
+        """
+        yield from self._journaled_rows()
+        if self.pages_done:
+            return
+
+        offset = self.pages[-1][0] + self.pages[-1][1] if self.pages else 0
+        yield from start_query(offset, self.record_page)
+        with self._lock:
+            self.pages_done = True
+            self._append({'pages_done': True})
+
+    def record_page(self, offset, rows):
+        with self._lock:
+            self.pages.append((offset, len(rows)))
+            self._append({'page': offset, 'rows': rows})
+
+    def record_written(self, written):
+        """Records that the JSON files have been written, along with anything the rest of the run needs to know."""
+        with self._lock:
+            self.written = written
+            self._append({'written': written})
+
+    def record_image(self, img, entry):
+        with self._lock:
+            self.images[img] = entry
+            self._append({'image': img, 'entry': entry})
+
+    def finish(self):
+        """Removes the journal, once the run it belongs to has completed."""
+        self._f.close()
+        os.remove(self.path)
@@ -2,48 +2,107 @@
     Script that accepts a RuneScript file and outputs the result as JSON that we can work with.
     Example: `python3 convertConfigToEquipment.py runescript.txt`
 
+    The file is read line by line: a `[debugname]` line starts a new item block, and each `key=value` line in the block
+    is collected into a map of key -> values. `param=name,value` lines are collected by param name instead, so a block
+    can have any number of them. Where a key or param appears more than once, the first value is used.
+
+    Any number of files or directories can be given, in which case every file is converted and the results are joined
+    in the order given (directories in sorted order). Inputs are memory-mapped and split into chunks at item
+    boundaries, which are converted across a pool of processes and written out as they finish, so that large cache
+    dumps convert in flat memory. Use `--ndjson` to write one item per line instead of a JSON array.
+    Example: `python3 convertConfigToEquipment.py --workers 8 --ndjson --output equipment.ndjson dump/`
+
     Written for Python 3.9.
 """
+import argparse
 import json
+import mmap
+import os
 import sys
-import re
 
-def find(pattern, input_str, fallback):
-    r = re.search(pattern, input_str)
-    if r is None:
-        return fallback
-    return r.group(1)
+import jsonstream
+import parallel
+
+# Rough size of the chunks that inputs are split into, in bytes
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Weapon categories that are named differently in the cache than on the wiki
+WEAPON_CATEGORIES = {
+    'weapon_thrown': 'Thrown',
+    'weapon_hacksword': 'Spiked', # TODO: ?
+    'weapon_tribrid': 'Multi-Style', # TODO: ?
+    'weapon_heavysword': '2h Sword',
+    'weapon_stabsword': 'Spear',
+}
+
+# Slots for non-weapons, by their wearpos value
+WEARPOS_SLOTS = {
+    'ring': 'ring',
+    'hands': 'hands',
+    'quiver': 'ammo',
+    'front': 'neck',
+    'lefthand': 'weapon',
+}
+
+
+class Block:
+    def __init__(self, debugname):
+        self.debugname = debugname
+        self.fields = {}
+        self.params = {}
+
+    def get(self, key, fallback=''):
+        values = self.fields.get(key)
+        return values[0] if values else fallback
+
+    def param(self, name, fallback=0):
+        values = self.params.get(name)
+        return int(values[0]) if values else fallback
+
 
-with open(sys.argv[1], 'r') as f:
-    text = f.read()
-    items = text.split(']')
+def tokenize(lines):
+    """Yields a Block for each item in the RuneScript, in one pass over its lines."""
+    block = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
 
-data = []
+        if line.startswith('[') and line.endswith(']'):
+            if block is not None:
+                yield block
+            block = Block(line[1:-1])
+            continue
 
-for i in items:
-    name = find("name=(.*)\n", i, "")
+        key, sep, value = line.partition('=')
+        if block is None or not sep:
+            continue
+
+        if key == 'param':
+            name, _, value = value.partition(',')
+            block.params.setdefault(name, []).append(value.strip())
+        else:
+            block.fields.setdefault(key, []).append(value)
+
+    if block is not None:
+        yield block
+
+
+def to_equipment(block):
+    """Converts an item block into our equipment format, or returns None if it isn't named."""
+    name = block.get('name')
     if name == '':
-        continue
+        return None
 
     slot = ''
-    cat = find("category=(.*)\n", i, "")
-    is2h = False
+    cat = block.get('category')
 
     # Determine the slot
     if cat.startswith('weapon_'):
         slot = 'weapon'
 
         # Determine the weapon category
-        if cat == 'weapon_thrown':
-            cat = 'Thrown'
-        elif cat == 'weapon_hacksword':
-            cat = 'Spiked' # TODO: ?
-        elif cat == 'weapon_tribrid':
-            cat = 'Multi-Style' # TODO: ?
-        elif cat == 'weapon_heavysword':
-            cat = '2h Sword'
-        elif cat == 'weapon_stabsword':
-            cat = 'Spear'
+        cat = WEAPON_CATEGORIES.get(cat, cat)
     else:
         if cat == 'armour_hands':
             slot = 'hands'
@@ -51,56 +110,141 @@ for i in items:
             slot = 'shield'
         else:
             # Use the wearpos value to interpret the slot
-            wearpos = find("wearpos=(.*)\n", i, "")
-            if wearpos == 'ring':
-                slot = 'ring'
-            elif wearpos == 'hands':
-                slot = 'hands'
-            elif wearpos == 'quiver':
-                slot = 'ammo'
-            elif wearpos == 'front':
-                slot = 'neck'
-            elif wearpos == 'lefthand':
-                slot = 'weapon'
+            slot = WEARPOS_SLOTS.get(block.get('wearpos'), '')
 
         # Non-weapons don't use a category, so we can blank it now
         cat = ''
 
     # Is it a two-handed weapon?
-    if re.search(r"param=loadout_iteminfo,.*(\^wearpos_rhand)", i):
-        is2h = True
+    is2h = any('^wearpos_rhand' in v for v in block.params.get('loadout_iteminfo', []))
 
-    equipment = {
+    return {
         'name': name,
         'id': 0,
         'version': '',
         'slot': slot,
         'image': '',
-        'speed': int(find(r"param=attackrate,(\d*)", i, 0)),
+        'speed': block.param('attackrate'),
         'category': cat,
         'bonuses': {
-            'str': int(find(r"param=strengthbonus,(\d*)", i, 0)),
-            'ranged_str': int(find(r"param=rangestrength,(\d*)", i, 0)),
+            'str': block.param('strengthbonus'),
+            'ranged_str': block.param('rangestrength'),
             'magic_str': 0, # TODO: ?
-            'prayer': int(find(r"param=prayerbonus,(\d*)", i, 0)),
+            'prayer': block.param('prayerbonus'),
         },
         'offensive': {
-            'stab': int(find(r"param=stabattack,(\d*)", i, 0)),
-            'slash': int(find(r"param=slashattack,(\d*)", i, 0)),
-            'crush': int(find(r"param=crushattack,(\d*)", i, 0)),
-            'magic': int(find(r"param=magicattack,(\d*)", i, 0)),
-            'ranged': int(find(r"param=rangeattack,(\d*)", i, 0)),
+            'stab': block.param('stabattack'),
+            'slash': block.param('slashattack'),
+            'crush': block.param('crushattack'),
+            'magic': block.param('magicattack'),
+            'ranged': block.param('rangeattack'),
         },
         'defensive': {
-            'stab': int(find(r"param=stabdefence,(\d*)", i, 0)),
-            'slash': int(find(r"param=slashdefence,(\d*)", i, 0)),
-            'crush': int(find(r"param=crushdefence,(\d*)", i, 0)),
-            'magic': int(find(r"param=magicdefence,(\d*)", i, 0)),
-            'ranged': int(find(r"param=rangedefence,(\d*)", i, 0)),
+            'stab': block.param('stabdefence'),
+            'slash': block.param('slashdefence'),
+            'crush': block.param('crushdefence'),
+            'magic': block.param('magicdefence'),
+            'ranged': block.param('rangedefence'),
         },
         'isTwoHanded': is2h
     }
 
-    data.append(equipment)
 
-print(json.dumps(data, ensure_ascii=False, indent=2))
+def convert(lines):
+    """Converts the lines of a RuneScript file into a list of equipment."""
+    data = []
+    for block in tokenize(lines):
+        equipment = to_equipment(block)
+        if equipment is not None:
+            data.append(equipment)
+    return data
+
+
+def find_chunks(path, chunk_size=CHUNK_SIZE):
+    """Splits a file into (path, start, end) byte ranges of about chunk_size, each ending just before a `[` line."""
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < len(mm):
+            end = mm.find(b'\n[', start + chunk_size)
+            end = len(mm) if end == -1 else end + 1
+            yield path, start, end
+            start = end
+
+
+def convert_chunk(path, start, end):
+    """Converts the items in a byte range of a file."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mm.seek(start)
+
+        def lines():
+            while mm.tell() < end:
+                yield mm.readline().decode('utf-8')
+
+        return convert(lines())
+
+
+def find_inputs(paths):
+    """Expands any directories into the files inside them."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    yield os.path.join(root, file)
+        else:
+            yield path
+
+
+def convert_all(paths, workers=1, chunk_size=CHUNK_SIZE):
+    """Yields the equipment from each input in order, converting up to `workers` chunks at a time."""
+    chunks = (c for path in find_inputs(paths) for c in find_chunks(path, chunk_size))
+    if workers <= 1:
+        for chunk in chunks:
+            yield from convert_chunk(*chunk)
+        return
+
+    for equipment in parallel.imap(_convert_chunk, chunks, workers):
+        yield from equipment
+
+
+def _convert_chunk(chunk):
+    return convert_chunk(*chunk)
+
+
+def write_json(data, out):
+    """Writes the equipment as a JSON array, one item at a time, laid out the same as json.dumps(data, indent=2)."""
+    jsonstream.dump(data, out)
+    out.write('\n')
+
+
+def write_ndjson(data, out):
+    for equipment in data:
+        out.write(json.dumps(equipment, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', nargs='+',
+                        help='RuneScript files, or directories of them, to convert')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to convert chunks of the inputs with')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='write one item per line instead of a JSON array')
+    parser.add_argument('--output', metavar='FILE', default=None,
+                        help='write to this file instead of stdout')
+    args = parser.parse_args()
+
+    data = convert_all(args.inputs, args.workers)
+    write = write_ndjson if args.ndjson else write_json
+    if args.output:
+        with open(args.output, 'w') as out:
+            write(data, out)
+    else:
+        write(data, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+    Schema-driven cleaning of bucket rows. The wiki's parser can leave `UNIQ--...-QINU` strip markers in text fields,
+    so each generator lists which of its bucket fields hold text, and FieldExtractor cleans just those fields (and the
+    strings inside them, for multi-value fields) once, as the row comes in. Numeric fields are passed through untouched.
+
+    Example:
+        extractor = FieldExtractor(['page_name', 'image'])
+        row, had_markers = extractor.extract(row)
+
+    Written for Python 3.9.
+"""
+import re
+
+import metrics
+
+MARKER = 'UNIQ--'
+strip_marker_regex = re.compile(r'[\'"`]*UNIQ--[a-zA-Z0-9]+-[0-9A-F]{8}-QINU[\'"`]*')
+
+
+def clean(value):
+    """Removes any parser markers and surrounding whitespace from a string."""
+    if MARKER in value:
+        value = strip_marker_regex.sub('', value)
+    return value.strip()
+
+
+class FieldExtractor:
+    def __init__(self, string_fields):
+        self.string_fields = tuple(string_fields)
+
+    def extract(self, row):
+        """Returns a copy of the row with its string fields cleaned, and whether any of them contained a marker."""
+        row = dict(row)
+        had_markers = False
+        for field in self.string_fields:
+            value = row.get(field)
+            if isinstance(value, str):
+                had_markers = had_markers or MARKER in value
+                row[field] = clean(value)
+            elif isinstance(value, list):
+                had_markers = had_markers or any(isinstance(v, str) and MARKER in v for v in value)
+                row[field] = [clean(v) if isinstance(v, str) else v for v in value]
+
+        if had_markers:
+            metrics.count('rows_with_parser_markers')
+            metrics.log(f"Stripped parser markers from {row.get('page_name_sub')}")
+        return row, had_markers
@@ -0,0 +1,64 @@
+"""
+    Record/replay storage for wiki responses. In record mode every response the scripts receive is written to a
+    fixture directory, keyed by its path and query string relative to the wiki base URL. Replaying that directory
+    (in-process, or over HTTP with serveWikiFixtures.py) lets the generators run offline and deterministically.
+
+    Written for Python 3.9.
+"""
+import hashlib
+import json
+import os
+
+import requests
+
+from cache import write_atomic
+
+
+class MissingFixtureError(requests.RequestException):
+    pass
+
+
+class FixtureStore:
+    def __init__(self, path):
+        self.path = path
+
+    def _base_path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], digest)
+
+    def save(self, key, r):
+        base_path = self._base_path(key)
+        write_atomic(base_path + '.body', r.content)
+        write_atomic(base_path + '.json', json.dumps({
+            'key': key,
+            'status': r.status_code,
+            'content_type': r.headers.get('Content-Type'),
+        }, indent=2).encode('utf-8'))
+
+    def lookup(self, key):
+        """Returns a (status, content_type, body) tuple for a recorded key, or None if it was never recorded."""
+        base_path = self._base_path(key)
+        try:
+            with open(base_path + '.json', 'r') as f:
+                meta = json.load(f)
+            with open(base_path + '.body', 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        return meta['status'], meta['content_type'], body
+
+    def load(self, key):
+        """Rebuilds a requests.Response for a recorded key."""
+        fixture = self.lookup(key)
+        if fixture is None:
+            raise MissingFixtureError(f'No recorded response for {key} in {self.path}')
+
+        status, content_type, body = fixture
+        r = requests.Response()
+        r.status_code = status
+        r.url = key
+        r._content = body
+        if content_type:
+            r.headers['Content-Type'] = content_type
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        return r
@@ -7,15 +7,35 @@
 
     Written for Python 3.9.
 """
-import os
-import requests
+import argparse
+import heapq
 import json
-import urllib.parse
+import os.path
+
+import bucket
+import changes
+import checkpoint
+import fields
+import images
+import indexes
+import jsonstream
+import metrics
+import optimize
+import shards
+import sprites
+import wiki
 
 FILE_NAME = '../cdn/json/equipment.json'
-WIKI_BASE = 'https://oldschool.runescape.wiki'
-API_BASE = WIKI_BASE + '/api.php'
 IMG_PATH = '../cdn/equipment/'
+IMG_MANIFEST_FILE_NAME = '../cdn/json/equipment_images.json'
+IMG_VARIANTS_FILE_NAME = '../cdn/json/equipment_image_variants.json'
+ATLAS_PATH = '../cdn/atlas/'
+ATLAS_INDEX_FILE_NAME = '../cdn/json/equipment_atlas.json'
+CHANGELOG_FILE_NAME = '../cdn/json/equipment_changes.json'
+CHECKPOINT_NAME = 'equipment.jsonl'
+INDEX_FILE_NAME = '../cdn/json/equipment_index.json'
+SHARD_PATH = '../cdn/json/equipment/'
+SHARDS_FILE_NAME = '../cdn/json/equipment_shards.json'
 
 BUCKET_API_FIELDS = [
     'page_name',
@@ -82,170 +102,255 @@ ITEMS_TO_SKIP = [
     'Thunder khopesh (Deadman Mode)'
 ]
 
-def getEquipmentData():
-    equipment = []
-    offset = 0
-    fields_csv = ",".join(map(repr, BUCKET_API_FIELDS))
-    while True:
-        print('Fetching equipment info: ' + str(offset))
-        query = {
-            'action': 'bucket',
-            'format': 'json',
-            'query': 
-            (
-                f"bucket('infobox_item')"
-                f".select({fields_csv})"
-                f".limit(500).offset({offset})"
-                f".where('infobox_bonuses.equipment_slot', '!=', bucket.Null())"
-                f".where('item_id', '!=', bucket.Null())"
-                f".join('infobox_bonuses', 'infobox_bonuses.page_name_sub', 'infobox_item.page_name_sub')"
-                f".orderBy('page_name_sub', 'asc').run()"
-            )
-        }
-
-        r = requests.get(API_BASE + '?' + urllib.parse.urlencode(query), headers={
-            'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
-        })
-
-        data = r.json()
-
-        if 'bucket' not in data:
-            # No results?
-            break
-
-        equipment = equipment + data['bucket']
-
-        # Bucket's API doesn't tell you when there are more results, so we'll just have to guess
-        if len(data['bucket']) == 500:
-            offset += 500
-        else:
-            # If we are at the end of the results, break out of this loop
-            break
+# Bucket fields that hold text, and so may contain parser markers that need stripping (see fields.py)
+STRING_FIELDS = [
+    'page_name',
+    'page_name_sub',
+    'item_name',
+    'image',
+    'item_id',
+    'version_anchor',
+    'infobox_bonuses.equipment_slot',
+    'infobox_bonuses.combat_style',
+]
+
+field_extractor = fields.FieldExtractor(STRING_FIELDS)
+
+def getEquipmentData(prefetch=bucket.DEFAULT_PREFETCH, api_fields=BUCKET_API_FIELDS, offset=0, on_page=None):
+    return bucket.query(
+        'infobox_item',
+        api_fields,
+        where=[
+            ('infobox_bonuses.equipment_slot', '!=', bucket.NULL),
+            ('item_id', '!=', bucket.NULL),
+        ],
+        join=('infobox_bonuses', 'infobox_bonuses.page_name_sub', 'infobox_item.page_name_sub'),
+        order=('page_name_sub', 'asc'),
+        prefetch=prefetch,
+        offset=offset,
+        on_page=on_page,
+    )
+
+
+def to_equipment(v):
+    """Converts a single infobox_item bucket row into our equipment format, or returns None if it should be skipped."""
+    v, _ = field_extractor.extract(v)
+
+    try:
+        item_id = int(v.get('item_id')[0]) if v.get('item_id') else None
+    except ValueError:
+        # Item has an invalid ID, do not show it here as it's probably historical or something.
+        metrics.log("Skipping - invalid item ID (not an int)")
+        return None
+
+    equipment = {
+        'name': v['page_name'],
+        'id': item_id,
+        'weight': v.get('weight', 0),
+        'version': v.get('version_anchor', ''),
+        'slot': v.get('infobox_bonuses.equipment_slot', ''),
+        'image': '' if not v.get('image') else v.get('image')[-1].replace('File:', ''),
+        'speed': v.get('infobox_bonuses.weapon_attack_speed', 0),
+        'category': v.get('infobox_bonuses.combat_style', ''),
+        'bonuses': {
+            'str': v.get('infobox_bonuses.strength_bonus'),
+            'ranged_str': v.get('infobox_bonuses.ranged_strength_bonus'),
+            'magic_str': int(v.get('infobox_bonuses.magic_damage_bonus', 0) * 10),
+            'prayer': v.get('infobox_bonuses.prayer_bonus'),
+        },
+        'offensive': {
+            'stab': v.get('infobox_bonuses.stab_attack_bonus'),
+            'slash': v.get('infobox_bonuses.slash_attack_bonus'),
+            'crush': v.get('infobox_bonuses.crush_attack_bonus'),
+            'magic': v.get('infobox_bonuses.magic_attack_bonus'),
+            'ranged': v.get('infobox_bonuses.range_attack_bonus'),
+        },
+        'defensive': {
+            'stab': v.get('infobox_bonuses.stab_defence_bonus'),
+            'slash': v.get('infobox_bonuses.slash_defence_bonus'),
+            'crush': v.get('infobox_bonuses.crush_defence_bonus'),
+            'magic': v.get('infobox_bonuses.magic_defence_bonus'),
+            'ranged': v.get('infobox_bonuses.range_defence_bonus'),
+        },
+        'isTwoHanded': False
+    }
+
+    # Handle 2H weapons
+    if equipment['slot'] == '2h':
+        equipment['slot'] = 'weapon'
+        equipment['isTwoHanded'] = True
+
+    # If this is an item from Nightmare Zone, it will become the main variant for all NMZ/SW/Emir's variants
+    if equipment['version'] == 'Nightmare Zone':
+        equipment['version'] = ''
+
+    # Skip last man standing items
+    if "(Last Man Standing)" in equipment['name']:
+        return None
+
+    if equipment['name'] in ITEMS_TO_SKIP:
+        return None
+
+    if "Keris partisan of amascut" in equipment['name'] and "Outside ToA" in v['page_name_sub']:
+        return None
 
     return equipment
 
 
-def main():
-    # Grab the equipment info using Bucket
-    wiki_data = getEquipmentData()
+def sort_key(equipment):
+    return equipment.get('name')
 
-    # Use an object rather than an array, so that we can't have duplicate items with the same page_name_sub
-    data = {}
-    required_imgs = []
 
-    # Loop over the equipment data from the wiki
-    for v in wiki_data:
-        if v['page_name_sub'] in data:
-            continue
+def shard_key(equipment):
+    return equipment.get('slot') or 'none'
 
-        print(f"Processing {v['page_name_sub']}")
 
-        try:
-            item_id = int(v.get('item_id')[0]) if v.get('item_id') else None
-        except ValueError:
-            # Item has an invalid ID, do not show it here as it's probably historical or something.
-            print("Skipping - invalid item ID (not an int)")
-            continue
+def iter_equipment(wiki_data, required_imgs):
+    """
+    Transforms the bucket rows into equipment, skipping rows for the same page_name_sub as an earlier one.
+    Adds the images the equipment needs to required_imgs as it goes.
+    """
+    seen = set()
 
-        equipment = {
-            'name': v['page_name'],
-            'id': item_id,
-            'weight': v.get('weight', 0),
-            'version': v.get('version_anchor', ''),
-            'slot': v.get('infobox_bonuses.equipment_slot', ''),
-            'image': '' if not v.get('image') else v.get('image')[-1].replace('File:', ''),
-            'speed': v.get('infobox_bonuses.weapon_attack_speed', 0),
-            'category': v.get('infobox_bonuses.combat_style', ''),
-            'bonuses': {
-                'str': v.get('infobox_bonuses.strength_bonus'),
-                'ranged_str': v.get('infobox_bonuses.ranged_strength_bonus'),
-                'magic_str': int(v.get('infobox_bonuses.magic_damage_bonus', 0) * 10),
-                'prayer': v.get('infobox_bonuses.prayer_bonus'),
-            },
-            'offensive': {
-                'stab': v.get('infobox_bonuses.stab_attack_bonus'),
-                'slash': v.get('infobox_bonuses.slash_attack_bonus'),
-                'crush': v.get('infobox_bonuses.crush_attack_bonus'),
-                'magic': v.get('infobox_bonuses.magic_attack_bonus'),
-                'ranged': v.get('infobox_bonuses.range_attack_bonus'),
-            },
-            'defensive': {
-                'stab': v.get('infobox_bonuses.stab_defence_bonus'),
-                'slash': v.get('infobox_bonuses.slash_defence_bonus'),
-                'crush': v.get('infobox_bonuses.crush_defence_bonus'),
-                'magic': v.get('infobox_bonuses.magic_defence_bonus'),
-                'ranged': v.get('infobox_bonuses.range_defence_bonus'),
-            },
-            'isTwoHanded': False
-        }
-
-        # Handle 2H weapons
-        if equipment['slot'] == '2h':
-            equipment['slot'] = 'weapon'
-            equipment['isTwoHanded'] = True
-
-        # If this is an item from Nightmare Zone, it will become the main variant for all NMZ/SW/Emir's variants
-        if equipment['version'] == 'Nightmare Zone':
-            equipment['version'] = ''
-
-        # Skip last man standing items
-        if "(Last Man Standing)" in equipment['name']:
+    # Loop over the equipment data from the wiki
+    for v in wiki_data:
+        if v['page_name_sub'] in seen:
             continue
 
-        if equipment['name'] in ITEMS_TO_SKIP:
-            continue
+        metrics.log(f"Processing {v['page_name_sub']}")
 
-        if "Keris partisan of amascut" in equipment['name'] and "Outside ToA" in v['page_name_sub']:
+        equipment = to_equipment(v)
+        if equipment is None:
             continue
 
-        # Set the current equipment item to the calc's equipment list
-        data[v['page_name_sub']] = equipment
-
+        seen.add(v['page_name_sub'])
         if not equipment['image'] == '':
-            required_imgs.append(equipment['image'])
-
-    new_data = list(data.values())
-
+            required_imgs.add(equipment['image'])
+        yield equipment
+
+
+def sort_equipment(equipment, manual_data):
+    """
+    Yields the equipment merged with the manual entries, sorted by name. Equipment with the same name is kept in the
+    order it came in, with the wiki's before the manual entries.
+    """
+    return heapq.merge(jsonstream.sort(equipment, sort_key), sorted(manual_data, key=sort_key), key=sort_key)
+
+
+def build_equipment(wiki_data, manual_data):
+    """
+    Transforms the bucket rows into the sorted list of equipment, including any manual entries.
+    Returns the equipment along with the set of images it needs.
+    """
+    required_imgs = set()
+    new_data = list(sort_equipment(iter_equipment(wiki_data, required_imgs), manual_data))
+    return new_data, required_imgs
+
+
+def add_arguments(parser):
+    parser.add_argument('--image-workers', type=int, default=images.DEFAULT_WORKERS,
+                        help='number of images to download concurrently')
+    parser.add_argument('--prefetch', type=int, default=bucket.DEFAULT_PREFETCH,
+                        help='number of bucket pages to request concurrently')
+    parser.add_argument('--refresh-images', action='store_true',
+                        help='re-check existing images against the wiki and replace any that have changed')
+    parser.add_argument('--atlas', action='store_true',
+                        help='also pack the images into sprite atlases in ' + ATLAS_PATH)
+    parser.add_argument('--index', action='store_true',
+                        help='also write prebuilt lookup indexes to ' + INDEX_FILE_NAME + ' (see indexes.py)')
+    parser.add_argument('--shards', action='store_true',
+                        help='also write sharded copies of the JSON to ' + SHARD_PATH + ' (see shards.py)')
+    optimize.add_arguments(parser)
+
+
+def load_manual_data():
     # add manual equipment that isn't pulled from the wiki
     # this should ONLY be used for upcoming items that are not yet released
     with open('manual_equipment.json', 'r') as f:
-        manual_data = json.load(f)
-        new_data = new_data + manual_data
+        return json.load(f)
 
-    print('Total equipment: ' + str(len(new_data)))
-    new_data.sort(key=lambda d: d.get('name'))
 
-    with open(FILE_NAME, 'w') as f:
-        print('Saving to JSON at file: ' + FILE_NAME)
-        json.dump(new_data, f, ensure_ascii=False, indent=2)
+def write_equipment(new_data, args):
+    """
+    Writes equipment.json from the equipment (any iterable, in order), followed by the files derived from it.
+    Returns how much equipment there was.
+    """
+    with metrics.stage('write'):
+        changed, count = changes.write_if_changed(FILE_NAME, new_data, CHANGELOG_FILE_NAME)
 
-    success_img_dls = 0
-    failed_img_dls = 0
-    skipped_img_dls = 0
-    required_imgs = set(required_imgs)
+        # The derived files are built from what was just written, rather than by keeping the equipment around
+        if args.index and (changed or not os.path.isfile(INDEX_FILE_NAME)):
+            indexes.write_index(jsonstream.load(FILE_NAME), INDEX_FILE_NAME)
 
-    # Fetch all the images from the wiki and store them for local serving
-    for idx, img in enumerate(required_imgs):
-        if os.path.isfile(IMG_PATH + img):
-            skipped_img_dls += 1
-            continue
+        if args.shards and (changed or shards.shards_missing(SHARDS_FILE_NAME)):
+            shards.write_shards(jsonstream.load(FILE_NAME), shard_key, SHARD_PATH, SHARDS_FILE_NAME)
+
+    return count
 
-        print(f'({idx}/{len(required_imgs)}) Fetching image: {img}')
-        r = requests.get(WIKI_BASE + '/w/Special:Filepath/' + img, headers={
-            'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
-        })
-        if r.ok:
-            with open(IMG_PATH + img, 'wb') as f:
-                f.write(r.content)
-                print('Saved image: ' + img)
-                success_img_dls += 1
-        else:
-            print('Unable to save image: ' + img)
-            failed_img_dls += 1
+
+def save_images(required_imgs, args, journal=None):
+    """Fetches the images the equipment needs (and packs the atlases, if asked to)."""
+    with metrics.stage('images'):
+        # Fetch all the images from the wiki and store them for local serving
+        manifest = images.load_manifest(IMG_MANIFEST_FILE_NAME, IMG_PATH)
+        cache = optimize.load_cache(IMG_VARIANTS_FILE_NAME)
+        success_img_dls, skipped_img_dls, failed_img_dls = images.download_images(
+            required_imgs, IMG_PATH, args.image_workers, args.refresh_images, manifest, journal, cache)
+        images.save_manifest(manifest, IMG_MANIFEST_FILE_NAME, required_imgs)
 
     print('Total images saved: ' + str(success_img_dls))
     print('Total images skipped (already exists): ' + str(skipped_img_dls))
     print('Total images failed to save: ' + str(failed_img_dls))
 
+    if args.optimize_images:
+        with metrics.stage('optimize'):
+            optimized, cached, failed = optimize.optimize_images(
+                required_imgs, IMG_PATH, manifest, cache, args.image_formats, args.optimize_workers)
+            optimize.save_cache(cache, IMG_VARIANTS_FILE_NAME, required_imgs)
+
+        print('Total images optimized: ' + str(optimized))
+        print('Total images skipped (already optimized): ' + str(cached))
+        print('Total images failed to optimize: ' + str(failed))
+        optimize.report(required_imgs, cache)
+
+    if args.atlas:
+        with metrics.stage('atlas'):
+            sprites.build_atlases(manifest, IMG_PATH, ATLAS_PATH, 'equipment', ATLAS_INDEX_FILE_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    wiki.add_arguments(parser)
+    metrics.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    args = parser.parse_args()
+    wiki.configure(args)
+    metrics.configure(args)
+
+    journal = checkpoint.Journal(os.path.join(args.checkpoint_dir, CHECKPOINT_NAME), args.resume)
+
+    if journal.written is not None:
+        count, required_imgs = journal.written['count'], set(journal.written['images'])
+    else:
+        # Stream the equipment info from Bucket. Pages are fetched lazily as the records below are written out
+        wiki_data = metrics.timed_iter('fetch', journal.query(
+            lambda offset, on_page: getEquipmentData(args.prefetch, offset=offset, on_page=on_page)))
+        manual_data = load_manual_data()
+
+        required_imgs = set()
+        new_data = metrics.timed_iter('transform', sort_equipment(
+            iter_equipment(wiki_data, required_imgs), manual_data))
+        count = write_equipment(new_data, args)
+        journal.record_written({'count': count, 'images': sorted(required_imgs)})
+
+    print('Total equipment: ' + str(count))
+
+    save_images(required_imgs, args, journal)
+
+    journal.finish()
+    metrics.write_report()
+
 
-main()
+if __name__ == '__main__':
+    main()
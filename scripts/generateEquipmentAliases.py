@@ -6,15 +6,17 @@
     Written for Python 3.9.
 """
 from collections import namedtuple
-import requests
-import urllib.parse
+import argparse
 import re
 import json
+import time
+
+import bucket
+import metrics
+import wiki
 
 FILE_NAME = '../src/lib/EquipmentAliases.ts'
 MAPPING_DICT_FILE_NAME = '../cdn/json/equipment_aliases.json'
-WIKI_BASE = 'https://oldschool.runescape.wiki'
-API_BASE = WIKI_BASE + '/api.php'
 
 BUCKET_API_FIELDS = [
     'page_name',
@@ -25,51 +27,21 @@ BUCKET_API_FIELDS = [
 ]
 
 
-def getEquipmentData():
-    equipment = []
-    offset = 0
-    fields_csv = ",".join(map(repr, BUCKET_API_FIELDS))
-    while True:
-        print('Fetching equipment info: ' + str(offset))
-        query = {
-            'action': 'bucket',
-            'format': 'json',
-            'query': 
-            (
-                f"bucket('infobox_item')"
-                f".select({fields_csv})"
-                f".limit(500).offset({offset})"
-                f".where('infobox_bonuses.equipment_slot', '!=', bucket.Null())"
-                f".where('item_id', '!=', bucket.Null())"
-                f".join('infobox_bonuses', 'infobox_bonuses.page_name_sub', 'infobox_item.page_name_sub')"
-                f".orderBy('page_name_sub', 'asc').run()"
-            )
-        }
-        r = requests.get(API_BASE + '?' + urllib.parse.urlencode(query), headers={
-            'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
-        })
-        data = r.json()
-
-        if 'bucket' not in data:
-            # No results?
-            break
-
-        equipment = equipment + data['bucket']
-
-        # Bucket's API doesn't tell you when there are more results, so we'll just have to guess
-        if len(data['bucket']) == 500:
-            offset += 500
-        else:
-            # If we are at the end of the results, break out of this loop
-            break
+def getEquipmentData(prefetch=bucket.DEFAULT_PREFETCH):
+    return bucket.query(
+        'infobox_item',
+        BUCKET_API_FIELDS,
+        where=[
+            ('infobox_bonuses.equipment_slot', '!=', bucket.NULL),
+            ('item_id', '!=', bucket.NULL),
+        ],
+        join=('infobox_bonuses', 'infobox_bonuses.page_name_sub', 'infobox_item.page_name_sub'),
+        order=('page_name_sub', 'asc'),
+        prefetch=prefetch,
+    )
 
 
-    return equipment
-
-
-data = {}
-
-dataJs = """/**
+DATA_JS_HEADER = """/**
  * A map of base item ID -> variant item IDs for items that are identical in function. This includes
  * "locked" variants of items, broken/degraded variants of armour and weapons, and cosmetic recolours of equipment.
  * @see https://oldschool.runescape.wiki/w/Trouver_parchment
@@ -78,11 +50,25 @@ const equipmentAliases = {"""
 
 EquipmentAliases = namedtuple('EquipmentAliases', ['base_name', 'base_version', 'alias_ids'])
 
-def handle_base_variant(all_items, variant_item, base_name, base_versions):
-    global data
-    base_variant = next((x for x in all_items if x['name'] == base_name and x['version'] in base_versions), None)
-    if base_variant:
-        data.setdefault(base_variant['id'], EquipmentAliases(base_name, base_variant['version'], [])).alias_ids.append(variant_item['id'])
+def build_item_index(all_items):
+    """
+    Indexes the (sorted) item list by (name, version), keeping each item's position so that lookups across several
+    versions still resolve to whichever match comes first in the list.
+    """
+    index = {}
+    for pos, item in enumerate(all_items):
+        index.setdefault((item['name'], item['version']), (pos, item))
+    return index
+
+
+def handle_base_variant(aliases, item_index, variant_item, base_name, base_versions):
+    if isinstance(base_versions, str):
+        base_versions = [base_versions]
+
+    matches = [item_index[(base_name, v)] for v in set(base_versions) if (base_name, v) in item_index]
+    if matches:
+        _, base_variant = min(matches, key=lambda m: m[0])
+        aliases.setdefault(base_variant['id'], EquipmentAliases(base_name, base_variant['version'], [])).alias_ids.append(variant_item['id'])
 
 one_off_renames = {
     "Dinh's blazing bulwark": "Dinh's bulwark",
@@ -106,25 +92,151 @@ one_off_renames = {
     "Soulreaper axe (o)": "Soulreaper axe"
 }
 
-def main():
-    global dataJs
+# An alias rule matches an item when its version satisfies `versions` (a predicate, or None for any version) and its
+# name matches `pattern` (a compiled regex, or None for any name). `rewrite(item, match)` then returns the base item's
+# (name, versions) to alias it to.
+AliasRule = namedtuple('AliasRule', ['name', 'pattern', 'versions', 'rewrite'])
+
+DECORATION_KIT_REGEX = re.compile(r"(.*)\((?:g|t|(h)\d|Arrav|Asgarnia|Dorgeshuun|Dragon|Fairy|Guthix|HAM|Horse|Jogre|Kandarin|Misthalin|Money|Saradomin|Skull|Varrock|Zamorak|or|cr|Hallowed|Trailblazer|Ithell|Iorwerth|Trahaearn|Cadarn|Crwys|Meilyr|Hefin|Amlodd|upgraded|light|dark|dusk|lit|deadman)\)$", re.IGNORECASE)
+
+
+def rewrite_locked(item, _):
+    decoration_kit_match = DECORATION_KIT_REGEX.match(item['name'])
+    # Locked and decorated
+    if decoration_kit_match:
+        return decoration_kit_match.group(1).strip(), ['Normal']
+    # Only locked
+    return item['name'], ['Normal']
+
+
+def rewrite_decoration_kit(item, match):
+    base_item_name = match.group(1).strip()
+    # Crystal armor should not be aliases across Active and Inactive
+    # Nor should items with weapon poison
+    if item['version'] in ['Active', 'Inactive', 'Unpoisoned', 'Poison', 'Poison+', 'Poison++']:
+        return base_item_name, [item['version']]
+    if base_item_name.endswith(" helm") and match.group(2) == "h":
+        return base_item_name.replace(" helm", " full helm"), [item['version']]
+    if base_item_name.endswith(" shield") and match.group(2) == "h":
+        return base_item_name.replace(" shield", " kiteshield"), [item['version']]
+    return base_item_name, ['', 'Normal']
+
+
+def rewrite_echo(item, _):
+    name = item['name'].removeprefix("Echo ")
+    name = name[0].upper() + name[1:]
+    if "Ahrim's" in name:
+        return name, ["Undamaged"]
+    return name, [item['version']]
+
+
+# Rules are checked in order, and the first one that matches an item wins
+ALIAS_RULES = [
+    # One off items
+    AliasRule('one-off', re.compile('^(?:%s)$' % '|'.join(map(re.escape, one_off_renames))), None,
+              lambda item, _: (one_off_renames[item['name']], [item['version']])),
+    # Ava's assembler variants (Must be before locked due to the base name change)
+    AliasRule('masori-assembler', re.compile(r"^Masori assembler(|\(l\))$"), None,
+              lambda item, _: ("Ava's assembler", ['Normal'])),
+    # Locked variants
+    AliasRule('locked', None, lambda v: v == 'Locked', rewrite_locked),
+    # Cosmetic Slayer helmets
+    AliasRule('slayer-helmet', re.compile(r"^(?:Black|Green|Red|Purple|Turquoise|Hydra|Twisted|Tztok|Vampyric|Tzkal|Araxyte|Hooded|Demonic|Radiant|Oathplate) slayer helmet( \(i\))?$"), None,
+              lambda item, m: ('Slayer helmet%s' % (m.group(1) or ''), ['', 'Nightmare Zone'])),
+    # Sanguine Torva
+    AliasRule('sanguine-torva', re.compile(r"^Sanguine t(orva (full helm|platebody|platelegs))$"), None,
+              lambda item, m: ('T%s' % (m.group(1) or ''), ['Restored'])),
+    # Amulet of glory variants
+    AliasRule('amulet-of-glory', re.compile(r"^Amulet of glory$"), lambda v: v != 'Uncharged',
+              lambda item, _: ('Amulet of glory', ['Uncharged'])),
+    AliasRule('amulet-of-glory-cosmetic', re.compile(r"^(?:Amulet of glory \(t\)|Amulet of eternal glory)$"), None,
+              lambda item, _: ('Amulet of glory', ['Uncharged'])),
+    # Decoration kit variants
+    AliasRule('decoration-kit', DECORATION_KIT_REGEX, None, rewrite_decoration_kit),
+    # Magic robe variants
+    AliasRule('magic-robe-kit', re.compile(r"^(?:Dark|Light|Twisted) ((?:infinity|ancestral) .*)$"), None,
+              lambda item, m: (m.group(1).capitalize(), [''])),
+    # Merge Soul Wars/Emir's Arena versions -> Nightmare Zone
+    AliasRule('soul-wars-emirs-arena', None, re.compile(r"^(Soul Wars|Emir's Arena)$").match,
+              lambda item, _: (item['name'], ['Nightmare Zone'])),
+    # Raging Echo League variants
+    AliasRule('echo', re.compile(r"^Echo (ahrim|venator|virtus)"), None, rewrite_echo),
+    # Degraded variants
+    AliasRule('degraded', None, re.compile(r"^(Broken|0|25|50|75|100)$").match,
+              lambda item, _: (item['name'], ['Undamaged'])),
+    # Moons armours
+    AliasRule('moons', re.compile(r"^(?!.*Crystal)"), re.compile(r"^(Used|New)").match,
+              lambda item, _: (item['name'], ['New'])),
+    # Dark Bow variants
+    AliasRule('dark-bow', re.compile(r"^Dark bow$"), lambda v: v != 'Regular',
+              lambda item, _: ("Dark bow", ['Regular'])),
+    AliasRule('dark-bow-deadman', re.compile(r"^Dark bow \(deadman\)$"), None,
+              lambda item, _: ("Dark bow", ['Regular'])),
+    # Granite maul variants
+    AliasRule('granite-maul', re.compile(r"^Granite maul$"), lambda v: v != 'Normal',
+              lambda item, _: ('Granite maul', ['Normal'])),
+    AliasRule('granite-maul-or', re.compile(r"^Granite maul \(or\)$"), None,
+              lambda item, _: ('Granite maul', ['Normal'])),
+    # Radiant oathplate variants
+    AliasRule('radiant-oathplate', re.compile(r"^Radiant"), None,
+              lambda item, _: (item['name'].replace("Radiant ", "").capitalize(), [''])),
+    AliasRule('black-mask', re.compile(r"^Black mask"), lambda v: v != '(10)',
+              lambda item, _: (item['name'], ['(10)'])),
+    AliasRule('void-seal', re.compile(r"^Void seal$"), lambda v: v != '(8)',
+              lambda item, _: (item['name'], ['(8)'])),
+]
+
+
+class AliasRuleDispatcher:
+    """Runs items through an ordered list of AliasRules, keeping per-rule hit counts and timings."""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.hits = {rule.name: 0 for rule in self.rules}
+        self.timings = {rule.name: 0.0 for rule in self.rules}
+
+    def resolve(self, item):
+        """Returns the (base name, base versions) from the first rule matching the item, or None."""
+        for rule in self.rules:
+            start = time.perf_counter()
+            match = None
+            matched = rule.versions is None or rule.versions(item['version'])
+            if matched and rule.pattern is not None:
+                match = rule.pattern.match(item['name'])
+                matched = match is not None
 
-    # Grab the equipment info using Bucket
-    wiki_data = getEquipmentData()
+            if not matched:
+                self.timings[rule.name] += time.perf_counter() - start
+                continue
 
+            resolved = rule.rewrite(item, match)
+            self.timings[rule.name] += time.perf_counter() - start
+            self.hits[rule.name] += 1
+            return resolved
+
+        return None
+
+    def print_report(self):
+        print('Alias rule hits:')
+        for rule in self.rules:
+            print(f'  {rule.name:<28} {self.hits[rule.name]:>6} hits  {self.timings[rule.name] * 1000:>8.2f}ms')
+
+
+def build_alias_items(wiki_data):
+    """Converts the bucket rows into a list of distinct items by ID, sorted by name."""
     # Use an object rather than an array, so that we can't have duplicate items with the same page_name_sub
     all_items = {}
 
     # Loop over the equipment data from the wiki
     for v in wiki_data:
 
-        print(f"Processing {v['page_name_sub']}")
+        metrics.log(f"Processing {v['page_name_sub']}")
 
         try:
             item_id = int(v.get('item_id')[0]) if v.get('item_id') else None
         except ValueError:
             # Item has an invalid ID, do not show it here as it's probably historical or something.
-            print("Skipping - invalid item ID (not an int)")
+            metrics.log("Skipping - invalid item ID (not an int)")
             continue
 
         if item_id in all_items:
@@ -140,97 +252,71 @@ def main():
 
     all_items = list(all_items.values())
     all_items.sort(key=lambda d: d.get('name'))
+    return all_items
+
 
+def build_aliases(all_items, dispatcher):
+    """Resolves each item against the dispatcher's rules, returning {base item ID: EquipmentAliases}."""
+    aliases = {}
+    item_index = build_item_index(all_items)
     for item in all_items:
-        slayer_helm_match = re.match(r"^(?:Black|Green|Red|Purple|Turquoise|Hydra|Twisted|Tztok|Vampyric|Tzkal|Araxyte|Hooded|Demonic|Radiant|Oathplate) slayer helmet( \(i\))?$", item['name'])
-        sanguine_torva_match = re.match(r"^Sanguine t(orva (full helm|platebody|platelegs))$", item['name'])
-        decoration_kit_match = re.match(r"(.*)\((?:g|t|(h)\d|Arrav|Asgarnia|Dorgeshuun|Dragon|Fairy|Guthix|HAM|Horse|Jogre|Kandarin|Misthalin|Money|Saradomin|Skull|Varrock|Zamorak|or|cr|Hallowed|Trailblazer|Ithell|Iorwerth|Trahaearn|Cadarn|Crwys|Meilyr|Hefin|Amlodd|upgraded|light|dark|dusk|lit|deadman)\)$", item['name'], re.IGNORECASE)
-        magic_robe_kit_match = re.match(r"^(?:Dark|Light|Twisted) ((?:infinity|ancestral) .*)$", item['name'])
-
-        # One off items:
-        if item['name'] in one_off_renames:
-            handle_base_variant(all_items, item, one_off_renames[item['name']], [item['version']])
-        # Ava's assembler variants (Must be before locked due to the base name change)
-        elif re.match(r"^Masori assembler(|\(l\))$", item['name']):
-            handle_base_variant(all_items, item, "Ava's assembler", ['Normal'])
-        # Locked variants
-        elif item['version'] == 'Locked':
-            # Locked and decorated
-            if decoration_kit_match:
-                handle_base_variant(all_items, item, decoration_kit_match.group(1).strip(), ['Normal'])
-            # Only locked
-            else:
-                handle_base_variant(all_items, item, item['name'], ['Normal'])
-        # Cosmetic Slayer helmets
-        elif slayer_helm_match:
-            handle_base_variant(all_items, item, 'Slayer helmet%s' % (slayer_helm_match.group(1) or ''), ['', 'Nightmare Zone'])
-        # Sanguine Torva
-        elif sanguine_torva_match:
-            handle_base_variant(all_items, item, 'T%s' % (sanguine_torva_match.group(1) or ''), ['Restored'])
-        # Amulet of glory variants
-        elif (item['name'] == 'Amulet of glory' and item['version'] != 'Uncharged') or item['name'] == 'Amulet of glory (t)' or item['name'] == 'Amulet of eternal glory':
-            handle_base_variant(all_items, item, 'Amulet of glory', ['Uncharged'])
-        # Decoration kit variants
-        elif decoration_kit_match:
-            base_item_name = decoration_kit_match.group(1).strip()
-            # Crystal armor should not be aliases across Active and Inactive
-            # Nor should items with weapon poison
-            if item['version'] in ['Active', 'Inactive', 'Unpoisoned', 'Poison', 'Poison+', 'Poison++']:
-                handle_base_variant(all_items, item, base_item_name, [item['version']])
-            elif base_item_name.endswith(" helm") and decoration_kit_match.group(2) == "h":
-                handle_base_variant(all_items, item, base_item_name.replace(" helm", " full helm"), [item['version']])
-            elif base_item_name.endswith(" shield") and decoration_kit_match.group(2) == "h":
-                handle_base_variant(all_items, item, base_item_name.replace(" shield", " kiteshield"), [item['version']])
-            else:
-                handle_base_variant(all_items, item, base_item_name, ['', 'Normal'])
-        # Magic robe variants
-        elif magic_robe_kit_match:
-            handle_base_variant(all_items, item, magic_robe_kit_match.group(1).capitalize(), [''])
-        # Merge Soul Wars/Emir's Arena versions -> Nightmare Zone
-        elif re.match(r"^(Soul Wars|Emir's Arena)$", item['version']):
-            handle_base_variant(all_items, item, item['name'], ['Nightmare Zone'])
-        # Raging Echo League variants
-        elif re.match(r"^Echo (ahrim|venator|virtus)", item['name']):
-            name = item['name'].removeprefix("Echo ")
-            name = name[0].upper() + name[1:]
-            if ("Ahrim's" in name):
-                handle_base_variant(all_items, item, name, "Undamaged")
-            else:
-                handle_base_variant(all_items, item, name, item['version'])
-        # Degraded variants
-        elif re.match(r"^(Broken|0|25|50|75|100)$", item['version']):
-            handle_base_variant(all_items, item, item['name'], ['Undamaged'])
-        # Moons armours
-        elif re.match(r"^(Used|New)", item['version']) and "Crystal" not in item['name']:
-            handle_base_variant(all_items, item, item['name'], ['New'])
-        # Dark Bow variants
-        elif (item['name'] == "Dark bow" and item['version'] != "Regular") or item['name'] == "Dark bow (deadman)":
-            handle_base_variant(all_items, item, "Dark bow", ['Regular'])
-        # Granite maul variants
-        elif (item['name'] == "Granite maul" and item['version'] != "Normal") or item['name'] == "Granite maul (or)":
-            handle_base_variant(all_items, item, 'Granite maul', ['Normal'])
-        # Radiant oathplate variants
-        elif re.match(r"^Radiant", item['name']):
-            handle_base_variant(all_items, item, item['name'].replace("Radiant ", "").capitalize(), '')
-        elif re.match("^Black mask", item['name']) and item['version'] != "(10)":
-            handle_base_variant(all_items, item, item['name'], ['(10)'])
-        elif item['name'] == "Void seal" and item['version'] != "(8)":
-            handle_base_variant(all_items, item, item['name'], ['(8)'])
+        resolved = dispatcher.resolve(item)
+        if resolved:
+            base_name, base_versions = resolved
+            handle_base_variant(aliases, item_index, item, base_name, base_versions)
+    return aliases
 
+
+def render_aliases(aliases):
+    """Returns the Typescript source for EquipmentAliases.ts, and the direct variant ID -> base ID mapping."""
+    dataJs = DATA_JS_HEADER
     mapping_dict = {}
-    for k, v in sorted(data.items(), key=lambda item: item[1].base_name):
+    for k, v in sorted(aliases.items(), key=lambda item: item[1].base_name):
         dataJs += '\n  %s: %s, // %s%s' % (k, v.alias_ids, v.base_name, f"#{v.base_version}" if v.base_version else "")
         for id in v.alias_ids:
             mapping_dict[id] = k
 
     dataJs += '\n};\n\nexport default equipmentAliases;\n'
+    return dataJs, mapping_dict
+
+
+def save_aliases(dataJs, mapping_dict):
+    with metrics.stage('write'):
+        with open(FILE_NAME, 'w') as f:
+            print('Saving to Typescript at file: ' + FILE_NAME)
+            f.write(dataJs)
+
+        with open(MAPPING_DICT_FILE_NAME, 'w') as f:
+            print('Saving direct mapping at file: ' + MAPPING_DICT_FILE_NAME)
+            json.dump(mapping_dict, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefetch', type=int, default=bucket.DEFAULT_PREFETCH,
+                        help='number of bucket pages to request concurrently')
+    wiki.add_arguments(parser)
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    wiki.configure(args)
+    metrics.configure(args)
+
+    # Stream the equipment info from Bucket. Pages are fetched lazily as the loop below consumes them
+    wiki_data = metrics.timed_iter('fetch', getEquipmentData(args.prefetch))
+
+    with metrics.stage('transform'):
+        all_items = build_alias_items(wiki_data)
+
+        dispatcher = AliasRuleDispatcher(ALIAS_RULES)
+        aliases = build_aliases(all_items, dispatcher)
+        dispatcher.print_report()
+
+        dataJs, mapping_dict = render_aliases(aliases)
+
+    save_aliases(dataJs, mapping_dict)
 
-    with open(FILE_NAME, 'w') as f:
-        print('Saving to Typescript at file: ' + FILE_NAME)
-        f.write(dataJs)
+    metrics.write_report()
 
-    with open(MAPPING_DICT_FILE_NAME, 'w') as f:
-        print('Saving direct mapping at file: ' + MAPPING_DICT_FILE_NAME)
-        json.dump(mapping_dict, f, ensure_ascii=False, indent=2)
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+    Runs generateEquipment.py and generateEquipmentAliases.py as a single pipeline. Both scripts query the same
+    infobox_item/infobox_bonuses rows, so this fetches the union of their fields once and hands the rows to each
+    transform, writing equipment.json (plus its images), EquipmentAliases.ts and equipment_aliases.json in one pass.
+
+    The rows are streamed into the equipment transform, the same as in generateEquipment.py. Only the few fields the
+    alias transform needs are kept aside from each row as it goes past, and the aliases are built from those once the
+    equipment has been written.
+
+    Takes the same options as generateEquipment.py.
+
+    Written for Python 3.9.
+"""
+import argparse
+import os
+
+import checkpoint
+import generateEquipment
+import generateEquipmentAliases
+import metrics
+import wiki
+
+# Fields needed by either transform. The equipment fields go first and unchanged, so that the query is the same one
+# generateEquipment.py sends (and can share its cached responses)
+BUCKET_API_FIELDS = generateEquipment.BUCKET_API_FIELDS + [
+    f for f in generateEquipmentAliases.BUCKET_API_FIELDS if f not in generateEquipment.BUCKET_API_FIELDS
+]
+# Fields of each row that the alias transform reads
+ALIAS_ROW_FIELDS = ['page_name', 'page_name_sub', 'item_id', 'version_anchor']
+CHECKPOINT_NAME = 'equipment_and_aliases.jsonl'
+
+
+def tap_alias_rows(wiki_data, alias_rows):
+    """Yields the bucket rows unchanged, adding a copy of just the fields the alias transform reads to alias_rows."""
+    for v in wiki_data:
+        alias_rows.append({k: v[k] for k in ALIAS_ROW_FIELDS if k in v})
+        yield v
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    generateEquipment.add_arguments(parser)
+    wiki.add_arguments(parser)
+    metrics.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    args = parser.parse_args()
+    wiki.configure(args)
+    metrics.configure(args)
+
+    journal = checkpoint.Journal(os.path.join(args.checkpoint_dir, CHECKPOINT_NAME), args.resume)
+
+    if journal.written is not None:
+        count, required_imgs = journal.written['count'], set(journal.written['images'])
+    else:
+        # Stream the equipment info from Bucket. Pages are fetched lazily as the records below are written out
+        wiki_data = metrics.timed_iter('fetch', journal.query(
+            lambda offset, on_page: generateEquipment.getEquipmentData(
+                args.prefetch, BUCKET_API_FIELDS, offset=offset, on_page=on_page)))
+        manual_data = generateEquipment.load_manual_data()
+
+        alias_rows = []
+        required_imgs = set()
+        new_data = metrics.timed_iter('transform', generateEquipment.sort_equipment(
+            generateEquipment.iter_equipment(tap_alias_rows(wiki_data, alias_rows), required_imgs), manual_data))
+        count = generateEquipment.write_equipment(new_data, args)
+
+        with metrics.stage('transform'):
+            all_items = generateEquipmentAliases.build_alias_items(alias_rows)
+            dispatcher = generateEquipmentAliases.AliasRuleDispatcher(generateEquipmentAliases.ALIAS_RULES)
+            aliases = generateEquipmentAliases.build_aliases(all_items, dispatcher)
+            dispatcher.print_report()
+
+            dataJs, mapping_dict = generateEquipmentAliases.render_aliases(aliases)
+
+        generateEquipmentAliases.save_aliases(dataJs, mapping_dict)
+        journal.record_written({'count': count, 'images': sorted(required_imgs)})
+
+    print('Total equipment: ' + str(count))
+
+    generateEquipment.save_images(required_imgs, args, journal)
+
+    journal.finish()
+    metrics.write_report()
+
+
+if __name__ == '__main__':
+    main()
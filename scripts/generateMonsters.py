@@ -7,17 +7,39 @@
 
     Written for Python 3.9.
 """
+import argparse
+import itertools
 import os.path
-
-import requests
 import json
-import urllib.parse
 import re
 
+import bucket
+import changes
+import checkpoint
+import defence
+import fields
+import images
+import indexes
+import jsonstream
+import metrics
+import optimize
+import parallel
+import shards
+import wiki
+
 FILE_NAME = '../cdn/json/monsters.json'
-WIKI_BASE = 'https://oldschool.runescape.wiki'
-API_BASE = WIKI_BASE + '/api.php'
 IMG_PATH = '../cdn/monsters/'
+IMG_MANIFEST_FILE_NAME = '../cdn/json/monster_images.json'
+IMG_VARIANTS_FILE_NAME = '../cdn/json/monster_image_variants.json'
+CHANGELOG_FILE_NAME = '../cdn/json/monster_changes.json'
+CHECKPOINT_NAME = 'monsters.jsonl'
+INDEX_FILE_NAME = '../cdn/json/monster_index.json'
+DEFENCE_ROLLS_FILE_NAME = '../cdn/json/monster_defence_rolls.json'
+SHARD_PATH = '../cdn/json/monsters/'
+SHARDS_FILE_NAME = '../cdn/json/monster_shards.json'
+
+# Number of bucket rows handed to a worker process at a time, when transforming in parallel
+CHUNK_SIZE = 250
 
 BUCKET_API_FIELDS = [
     'page_name',
@@ -61,292 +83,374 @@ BUCKET_API_FIELDS = [
     'burn_immune'
 ]
 
-def get_monster_data():
-    monsters = []
-    offset = 0
-    fields_csv = ",".join(map(repr, BUCKET_API_FIELDS))
-    while True:
-        print('Fetching monster info: ' + str(offset))
-        query = {
-            'action': 'bucket',
-            'format': 'json',
-            'query': 
-            (
-                f"bucket('infobox_monster')"
-                f".select({fields_csv})"
-                f".limit(500).offset({offset})"
-                f".where(bucket.Not('Category:Discontinued content'))"
-                f".orderBy('page_name_sub', 'asc').run()"
-            )
-        }
-
-        r = requests.get(API_BASE + '?' + urllib.parse.urlencode(query), headers={
-            'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
-        })
-        data = r.json()
-
-        if 'bucket' not in data:
-            # No results?
-            break
-
-        monsters = monsters + data['bucket']
-
-        # Bucket's API doesn't tell you when there are more results, so we'll just have to guess
-        if len(data['bucket']) == 500:
-            offset += 500
-        else:
-            # If we are at the end of the results, break out of this loop
-            break
-
-    return monsters
-
-
-strip_marker_regex = re.compile(r'[\'"`]*UNIQ--[a-zA-Z0-9]+-[0-9A-F]{8}-QINU[\'"`]*')
+def get_monster_data(prefetch=bucket.DEFAULT_PREFETCH, offset=0, on_page=None):
+    return bucket.query(
+        'infobox_monster',
+        BUCKET_API_FIELDS,
+        where=[(bucket.Not('Category:Discontinued content'),)],
+        order=('page_name_sub', 'asc'),
+        prefetch=prefetch,
+        offset=offset,
+        on_page=on_page,
+    )
 
-def strip_parser_tags(value):
-    if isinstance(value, dict):
-        return {k: strip_parser_tags(v) for k, v in value.items()}
-    elif isinstance(value, list):
-        return [strip_parser_tags(item) for item in value]
-    elif isinstance(value, str):
-        return strip_marker_regex.sub('', value).strip()
-    else:
-        return value
-
-def main():
-    # Grab the monster info using Bucket
-    wiki_data = get_monster_data()
-
-    # Convert the data into our own JSON structure
-    data = []
-    required_imgs = []
 
-    monsters_to_skip = []
+MONSTERS_TO_SKIP = []
 
-    # Loop over the monsters data from the wiki
-    for v in wiki_data:
-        k = v['page_name_sub']
+# Bucket fields that hold text, and so may contain parser markers that need stripping (see fields.py)
+STRING_FIELDS = [
+    'page_name',
+    'page_name_sub',
+    'attack_style',
+    'image',
+    'max_hit',
+    'attribute',
+    'name',
+    'slayer_category',
+    'id',
+    'elemental_weakness',
+    'burn_immune',
+]
 
-        # We split the key instead of using the Version anchor prop here to account for monsters with custom |smwname=
+field_extractor = fields.FieldExtractor(STRING_FIELDS)
+
+def to_monster(v):
+    """Converts a single infobox_monster bucket row into our monster format, or returns None if it should be skipped."""
+    v, _ = field_extractor.extract(v)
+    k = v['page_name_sub']
+
+    # We split the key instead of using the Version anchor prop here to account for monsters with custom |smwname=
+    try:
+        version = k.split('#', 1)[1].strip()
+    except IndexError:
+        version = ''
+
+    # If this is a CoX monster Challenge Mode variant, remove it. This will be handled by the calculator UI.
+    if 'Challenge Mode' in version:
+        metrics.log(k + ' is a CoX CM variant - skipping.')
+        return None
+
+    if 'Deadman' in k:
+        return None
+
+    # Skip monsters that aren't in the main namespace on the wiki
+    if re.match("^([A-z]*):", k):
+        return None
+
+    if v.get('page_name') in MONSTERS_TO_SKIP:
+        return None
+
+    # Skip Fight Caves spawn point monsters
+    if 'Spawn point' in version:
+        return None
+
+    # Skip Duke Sucellus non-attackable monsters and Hueycoatyl defeated
+    if 'Asleep' in version or 'Defeated' in version:
+        return None
+
+    # Skip Guardians of the Rift barriers which are not attackable
+    if re.match("^(Strong|Weak|Medium|Overcharged) Barrier$", k):
+        return None
+
+    monster_style = v.get('attack_style')
+    if monster_style == 'None' or monster_style == 'N/A':
+        monster_style = None
+
+    burn_immunity = v.get('burn_immune')
+    if burn_immunity:
+        if 'weak' in burn_immunity.lower():
+            burn_immunity = 'Weak'
+        elif 'normal' in burn_immunity.lower():
+            burn_immunity = 'Normal'
+        elif 'strong' in burn_immunity.lower():
+            burn_immunity = 'Strong'
+        else:
+            burn_immunity = None
+
+    # Override style specifically for Spinolyps. Both attacks roll ranged vs ranged.
+    # This "patch" will have to be revisited if/when we add protection prayers.
+    if 'Spinolyp' in k:
+        monster_style = ['Ranged']
+
+    metrics.log(f"Processing {v['page_name_sub']}")
+
+    try:
+        monster_id = int(v.get('id')[0]) if v.get('id') else None
+    except ValueError:
+        # Monster has an invalid ID, do not show it here as it's probably historical or something.
+        metrics.log("Skipping - invalid monster ID (not an int)")
+        return None
+
+    monster = {
+        'id': monster_id,
+        'name': v.get('page_name'),
+        'version': version,
+        'image': '' if not v.get('image') else v.get('image')[-1].replace('File:', ''),
+        'level': v.get('combat_level', 0),
+        'speed': v.get('attack_speed', 0),
+        'style': monster_style,
+        'size': v.get('size', 0),
+        'max_hit': v.get('max_hit')[0] if v.get('max_hit') else 0,
+        'skills': {
+            'atk': v.get('attack_level', 0),
+            'def': v.get('defence_level', 0),
+            'hp': v.get('hitpoints', 0),
+            'magic': v.get('magic_level', 0),
+            'ranged': v.get('ranged_level', 0),
+            'str': v.get('strength_level', 0)
+        },
+        'offensive': {
+            'atk': v.get('attack_bonus', 0),
+            'magic': v.get('magic_attack_bonus', 0),
+            'magic_str': v.get('magic_damage_bonus', 0),
+            'ranged': v.get('range_attack_bonus', 0),
+            'ranged_str': v.get('range_strength_bonus', 0),
+            'str': v.get('strength_bonus', 0)
+        },
+        'defensive': {
+            'flat_armour': v.get('flat_armour', 0),
+            'crush': v.get('crush_defence_bonus', 0),
+            'magic': v.get('magic_defence_bonus', 0),
+            'heavy': v.get('heavy_range_defence_bonus', 0),
+            'standard': v.get('standard_range_defence_bonus', 0),
+            'light': v.get('light_range_defence_bonus', 0),
+            'slash': v.get('slash_defence_bonus', 0),
+            'stab': v.get('stab_defence_bonus', 0)
+        },
+        'attributes': v.get('attribute', []),
+        'immunities': {
+            'burn': burn_immunity,
+        },
+        'is_slayer_monster': v.get('slayer_experience') is not None,
+    }
+
+    if 'Awakened' in version:
+        monster['is_slayer_monster'] = False
+    if monster['name'] == 'Lizardman shaman (Chambers of Xeric)':
+        monster['is_slayer_monster'] = True
+
+    weakness = v.get('elemental_weakness')
+    if weakness:
         try:
-            version = k.split('#', 1)[1]
-        except IndexError:
-            version = ''
+            monster['weakness'] = {
+                'element': weakness.lower(),
+                'severity': int(v.get('elemental_weakness_percent', 0))
+            }
+        except:
+            monster['weakness'] = None
+    else:
+        monster['weakness'] = None
+
+    if monster['id'] == 14779: # Gemstone crab has infinite hp which the wiki returns as 0
+        monster['skills']['hp'] = 50000
+
+    # Prune...
+    if (
+            # ...monsters that do not have any hitpoints
+            monster['skills']['hp'] == 0
+            # ...monsters that don't have an ID
+            or monster['id'] is None
+            # ...monsters that are historical
+            or '(historical)' in str.lower(monster['name'])
+            # ...monsters from the PvM arena
+            or '(pvm arena)' in str.lower(monster['name'])
+            # ...monsters from DMM Apocalypse
+            or '(deadman: apocalypse)' in str.lower(monster['name'])
+    ):
+        return None
+
+    if monster['name'] == "Doom of Mokhaiotl" and ("Shielded" in v.get('name') or "Burrowed" in v.get('name')):
+        return None
+
+    if monster['name'] == "Araxxor":
+        if "In combat" in version:
+            monster['version'] = ""
+        else:
+            return None
 
-        # If this is a CoX monster Challenge Mode variant, remove it. This will be handled by the calculator UI.
-        if 'Challenge Mode' in version:
-            print(k + ' is a CoX CM variant - skipping.')
-            continue
+    return monster
 
-        if 'Deadman' in k:
-            continue
 
-        # Skip monsters that aren't in the main namespace on the wiki
-        if re.match("^([A-z]*):", k):
-            continue
+def _init_worker(quiet):
+    # Worker processes may not have inherited the parent's settings, depending on how they were started
+    metrics.quiet = quiet
 
-        if v.get('page_name') in monsters_to_skip:
-            continue
 
-        # Skip Fight Caves spawn point monsters
-        if 'Spawn point' in version:
-            continue
+def _to_monsters(rows):
+    return [to_monster(v) for v in rows]
 
-        # Skip Duke Sucellus non-attackable monsters and Hueycoatyl defeated
-        if 'Asleep' in version or 'Defeated' in version:
-            continue
 
-        # Skip Guardians of the Rift barriers which are not attackable
-        if re.match("^(Strong|Weak|Medium|Overcharged) Barrier$", k):
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def transform_rows(wiki_data, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Yields to_monster() of each bucket row, in order. With more than one worker, the rows are split into chunks and
+    transformed across a pool of processes as they arrive.
+    """
+    if workers <= 1:
+        for v in wiki_data:
+            yield to_monster(v)
+        return
+
+    # Chunks are submitted as the rows arrive, and their results handed back in the order they were submitted
+    for monsters in parallel.imap(_to_monsters, _chunks(wiki_data, chunk_size), workers,
+                                  initializer=_init_worker, initargs=(metrics.quiet,)):
+        yield from monsters
+
+
+def iter_monsters(wiki_data, manual_monsters, required_imgs, workers=1):
+    """
+    Transforms the bucket rows into monsters, followed by any manual entries.
+    Adds the images the monsters need to required_imgs as it goes.
+    """
+    # Loop over the monsters data from the wiki
+    for monster in transform_rows(wiki_data, workers):
+        if monster is None:
             continue
 
-        monster_style = v.get('attack_style')
-        if monster_style == 'None' or monster_style == 'N/A':
-            monster_style = None
-
-        burn_immunity = v.get('burn_immune')
-        if burn_immunity:
-            if 'weak' in burn_immunity.lower():
-                burn_immunity = 'Weak'
-            elif 'normal' in burn_immunity.lower():
-                burn_immunity = 'Normal'
-            elif 'strong' in burn_immunity.lower():
-                burn_immunity = 'Strong'
-            else:
-                burn_immunity = None
-
-        # Override style specifically for Spinolyps. Both attacks roll ranged vs ranged.
-        # This "patch" will have to be revisited if/when we add protection prayers.
-        if 'Spinolyp' in k:
-            monster_style = ['Ranged']
+        if not monster['image'] == '':
+            required_imgs.add(monster['image'])
+        yield monster
 
-        print(f"Processing {v['page_name_sub']}")
+    for m in manual_monsters:
+        img = m.get('image')
+        if img:
+            required_imgs.add(img)
+        yield m
 
-        try:
-            monster_id = int(v.get('id')[0]) if v.get('id') else None
-        except ValueError:
-            # Monster has an invalid ID, do not show it here as it's probably historical or something.
-            print("Skipping - invalid monster ID (not an int)")
-            continue
-
-        monster = {
-            'id': monster_id,
-            'name': v.get('page_name'),
-            'version': version,
-            'image': '' if not v.get('image') else v.get('image')[-1].replace('File:', ''),
-            'level': v.get('combat_level', 0),
-            'speed': v.get('attack_speed', 0),
-            'style': monster_style,
-            'size': v.get('size', 0),
-            'max_hit': v.get('max_hit')[0] if v.get('max_hit') else 0,
-            'skills': {
-                'atk': v.get('attack_level', 0),
-                'def': v.get('defence_level', 0),
-                'hp': v.get('hitpoints', 0),
-                'magic': v.get('magic_level', 0),
-                'ranged': v.get('ranged_level', 0),
-                'str': v.get('strength_level', 0)
-            },
-            'offensive': {
-                'atk': v.get('attack_bonus', 0),
-                'magic': v.get('magic_attack_bonus', 0),
-                'magic_str': v.get('magic_damage_bonus', 0),
-                'ranged': v.get('range_attack_bonus', 0),
-                'ranged_str': v.get('range_strength_bonus', 0),
-                'str': v.get('strength_bonus', 0)
-            },
-            'defensive': {
-                'flat_armour': v.get('flat_armour', 0),
-                'crush': v.get('crush_defence_bonus', 0),
-                'magic': v.get('magic_defence_bonus', 0),
-                'heavy': v.get('heavy_range_defence_bonus', 0),
-                'standard': v.get('standard_range_defence_bonus', 0),
-                'light': v.get('light_range_defence_bonus', 0),
-                'slash': v.get('slash_defence_bonus', 0),
-                'stab': v.get('stab_defence_bonus', 0)
-            },
-            'attributes': v.get('attribute', []),
-            'immunities': {
-                'burn': burn_immunity,
-            },
-            'is_slayer_monster': v.get('slayer_experience') is not None,
-        }
-
-        if 'Awakened' in version:
-            monster['is_slayer_monster'] = False
-        if monster['name'] == 'Lizardman shaman (Chambers of Xeric)':
-            monster['is_slayer_monster'] = True
-
-        weakness = v.get('elemental_weakness')
-        if weakness:
-            try:
-                monster['weakness'] = {
-                    'element': weakness.lower(),
-                    'severity': int(v.get('elemental_weakness_percent', 0))
-                }
-            except:
-                monster['weakness'] = None
-        else:
-            monster['weakness'] = None
 
-        if monster['id'] == 14779: # Gemstone crab has infinite hp which the wiki returns as 0
-            monster['skills']['hp'] = 50000
-
-        # Prune...
-        if (
-                # ...monsters that do not have any hitpoints
-                monster['skills']['hp'] == 0
-                # ...monsters that don't have an ID
-                or monster['id'] is None
-                # ...monsters that are historical
-                or '(historical)' in str.lower(monster['name'])
-                # ...monsters from the PvM arena
-                or '(pvm arena)' in str.lower(monster['name'])
-                # ...monsters from DMM Apocalypse
-                or '(deadman: apocalypse)' in str.lower(monster['name'])
-        ):
-            continue
+def build_monsters(wiki_data, manual_monsters, workers=1):
+    """
+    Transforms the bucket rows into the list of monsters, followed by any manual entries.
+    Returns the monsters along with the set of images they need.
+    """
+    required_imgs = set()
+    data = list(iter_monsters(wiki_data, manual_monsters, required_imgs, workers))
+    return data, required_imgs
 
-        if monster['name'] == "Doom of Mokhaiotl" and ("Shielded" in v.get('name') or "Burrowed" in v.get('name')):
-            continue
 
-        if monster['name'] == "Araxxor":
-            if "In combat" in version:
-                monster['version'] = ""
-            else:
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image-workers', type=int, default=images.DEFAULT_WORKERS,
+                        help='number of images to download concurrently')
+    parser.add_argument('--prefetch', type=int, default=bucket.DEFAULT_PREFETCH,
+                        help='number of bucket pages to request concurrently')
+    parser.add_argument('--refresh-images', action='store_true',
+                        help='re-check existing images against the wiki and replace any that have changed')
+    parser.add_argument('--transform-workers', type=int, default=1,
+                        help='number of processes to transform the monster rows with')
+    parser.add_argument('--index', action='store_true',
+                        help='also write prebuilt lookup indexes to ' + INDEX_FILE_NAME + ' (see indexes.py)')
+    parser.add_argument('--shards', action='store_true',
+                        help='also write sharded copies of the JSON to ' + SHARD_PATH + ' (see shards.py)')
+    parser.add_argument('--defence-rolls', action='store_true',
+                        help='also write precomputed defence rolls to ' + DEFENCE_ROLLS_FILE_NAME + ' (see defence.py)')
+    optimize.add_arguments(parser)
+    wiki.add_arguments(parser)
+    metrics.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    args = parser.parse_args()
+    wiki.configure(args)
+    metrics.configure(args)
+
+    journal = checkpoint.Journal(os.path.join(args.checkpoint_dir, CHECKPOINT_NAME), args.resume)
+
+    if journal.written is not None:
+        count, required_imgs = journal.written['count'], set(journal.written['images'])
+    else:
+        # Stream the monster info from Bucket. Pages are fetched lazily as the records below are written out
+        wiki_data = metrics.timed_iter('fetch', journal.query(
+            lambda offset, on_page: get_monster_data(args.prefetch, offset=offset, on_page=on_page)))
+
+        with open('manual_monster.json', 'r') as f:
+            manual_monsters = json.load(f)
+
+        # Convert the data into our own JSON structure
+        required_imgs = set()
+        data = metrics.timed_iter('transform', iter_monsters(
+            wiki_data, manual_monsters, required_imgs, args.transform_workers))
+
+        with metrics.stage('write'):
+            # Save the JSON, if anything has changed since the last run
+            changed, count = changes.write_if_changed(FILE_NAME, data, CHANGELOG_FILE_NAME)
+
+            # The derived files are built from what was just written, rather than by keeping the monsters around
+            if args.index and (changed or not os.path.isfile(INDEX_FILE_NAME)):
+                indexes.write_index(jsonstream.load(FILE_NAME), INDEX_FILE_NAME)
+
+            if args.defence_rolls and (changed or not os.path.isfile(DEFENCE_ROLLS_FILE_NAME)):
+                defence.write_table(jsonstream.load(FILE_NAME), DEFENCE_ROLLS_FILE_NAME)
+
+            if args.shards and (changed or shards.shards_missing(SHARDS_FILE_NAME)):
+                shards.write_shards(jsonstream.load(FILE_NAME), shards.name_bucket, SHARD_PATH, SHARDS_FILE_NAME)
+
+        journal.record_written({'count': count, 'images': sorted(required_imgs)})
+
+    print('Total monsters: ' + str(count))
+
+    with metrics.stage('images'):
+        removed_count = 0
+        # Delete any images that are no longer required while enumerating existing files, along with their variants
+        keep = set(required_imgs)
+        keep.update(name for img in required_imgs for name in optimize.variant_names(img))
+        if os.path.isdir(IMG_PATH):
+            for root, _, files in os.walk(IMG_PATH):
+                for file in files:
+                    rel_path = os.path.relpath(os.path.join(root, file), IMG_PATH).replace(os.sep, '/')
+                    if rel_path not in keep:
+                        to_remove = os.path.join(root, file)
+                        try:
+                            os.remove(to_remove)
+                            print(f'Removed obsolete image: {rel_path}')
+                            removed_count += 1
+                        except OSError as e:
+                            print(f'Failed to remove obsolete image: {rel_path} ({e})')
+
+        # Filter out images that would clash on case-insensitive filesystems before fetching
+        saved_image_paths = set()
+        imgs_to_fetch = []
+        for img in required_imgs:
+            dest_path = IMG_PATH + img
+            if dest_path.lower() in saved_image_paths:
+                print('[WARN] Case-sensitive image filename clashes: ' + dest_path)
                 continue
 
-        monster = strip_parser_tags(monster)
-
-        data.append(monster)
-        if not monster['image'] == '':
-            required_imgs.append(monster['image'])
-
-    with open('manual_monster.json', 'r') as f:
-        manual_monsters = json.load(f)
-        for m in manual_monsters:
-            img = m.get('image')
-            if img: 
-                required_imgs.append(img)
-        data = data + manual_monsters
-
-    print('Total monsters: ' + str(len(data)))
-
-    # Save the JSON
-    with open(FILE_NAME, 'w') as f:
-        print('Saving to JSON at file: ' + FILE_NAME)
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    success_img_dls = 0
-    failed_img_dls = 0
-    skipped_img_dls = 0
-    required_imgs = set(required_imgs)
-
-    removed_count = 0
-    # Delete any images that are no longer required while enumerating existing files
-    if os.path.isdir(IMG_PATH):
-        for root, _, files in os.walk(IMG_PATH):
-            for file in files:
-                rel_path = os.path.relpath(os.path.join(root, file), IMG_PATH).replace(os.sep, '/')
-                if rel_path not in required_imgs:
-                    to_remove = os.path.join(root, file)
-                    try:
-                        os.remove(to_remove)
-                        print(f'Removed obsolete image: {rel_path}')
-                        removed_count += 1
-                    except OSError as e:
-                        print(f'Failed to remove obsolete image: {rel_path} ({e})')
-
-    # Fetch all the images from the wiki and store them for local serving
-    saved_image_paths = set()
-    for idx, img in enumerate(required_imgs):
-        dest_path = IMG_PATH + img
-        if dest_path.lower() in saved_image_paths:
-            print('[WARN] Case-sensitive image filename clashes: ' + dest_path)
-            continue
-
-        saved_image_paths.add(dest_path.lower())
-        if os.path.isfile(dest_path):
-            skipped_img_dls += 1
-            continue
+            saved_image_paths.add(dest_path.lower())
+            imgs_to_fetch.append(img)
 
-        print(f'({idx}/{len(required_imgs)}) Fetching image: {img}')
-        r = requests.get(WIKI_BASE + '/w/Special:Filepath/' + img, headers={
-            'User-Agent': 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
-        })
-        if r.status_code == 200:
-            with open(dest_path, 'wb') as f:
-                f.write(r.content)
-                print('Saved image: ' + img)
-                success_img_dls += 1
-        else:
-            print('Unable to save image: ' + img)
-            failed_img_dls += 1
+        # Fetch all the images from the wiki and store them for local serving
+        manifest = images.load_manifest(IMG_MANIFEST_FILE_NAME, IMG_PATH)
+        cache = optimize.load_cache(IMG_VARIANTS_FILE_NAME)
+        success_img_dls, skipped_img_dls, failed_img_dls = images.download_images(
+            imgs_to_fetch, IMG_PATH, args.image_workers, args.refresh_images, manifest, journal, cache)
+        images.save_manifest(manifest, IMG_MANIFEST_FILE_NAME, imgs_to_fetch)
 
     print('Total images saved: ' + str(success_img_dls))
     print('Total images skipped (already exists): ' + str(skipped_img_dls))
     print('Total images failed to save: ' + str(failed_img_dls))
     print('Total obsolete images removed: ' + str(removed_count))
 
+    if args.optimize_images:
+        with metrics.stage('optimize'):
+            optimized, cached, failed = optimize.optimize_images(
+                imgs_to_fetch, IMG_PATH, manifest, cache, args.image_formats, args.optimize_workers)
+            optimize.save_cache(cache, IMG_VARIANTS_FILE_NAME, imgs_to_fetch)
+
+        print('Total images optimized: ' + str(optimized))
+        print('Total images skipped (already optimized): ' + str(cached))
+        print('Total images failed to optimize: ' + str(failed))
+        optimize.report(imgs_to_fetch, cache)
+
+    journal.finish()
+    metrics.write_report()
+
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+    Shared image download stage for the generator scripts. Images are fetched from the wiki's Special:Filepath
+    endpoint using a bounded pool of worker threads that share a single keep-alive session.
+
+    Each image directory also has a manifest recording the SHA-256, dimensions and size of every image, keyed by
+    its wiki file name. When a manifest is passed in, an image is only skipped if it's both in the manifest and on
+    disk, and the manifest is kept up to date with whatever gets downloaded.
+
+    Written for Python 3.9.
+"""
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from PIL import Image, UnidentifiedImageError
+
+import metrics
+import optimize
+import wiki
+
+# Only an upper bound: the scheduler in throttle.py decides how many downloads actually run at once
+DEFAULT_WORKERS = wiki.POOL_SIZE
+
+
+SAVED = 'saved'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+
+def image_entry(content):
+    """Builds the manifest entry for an image's raw bytes."""
+    try:
+        with Image.open(io.BytesIO(content)) as im:
+            width, height = im.size
+    except UnidentifiedImageError:
+        width, height = None, None
+
+    return {
+        'sha256': hashlib.sha256(content).hexdigest(),
+        'width': width,
+        'height': height,
+        'bytes': len(content),
+    }
+
+
+def load_manifest(manifest_path, img_path):
+    """Loads an image manifest, building it from the images on disk if there isn't one yet."""
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)['images']
+
+    print('Building image manifest from: ' + img_path)
+    manifest = {}
+    if os.path.isdir(img_path):
+        for root, _, files in os.walk(img_path):
+            for file in files:
+                if optimize.is_variant(file):
+                    continue
+                full_path = os.path.join(root, file)
+                with open(full_path, 'rb') as f:
+                    manifest[os.path.relpath(full_path, img_path).replace(os.sep, '/')] = image_entry(f.read())
+    return manifest
+
+
+def save_manifest(manifest, manifest_path, required_imgs):
+    """Writes the manifest, first dropping any images that are no longer required from it."""
+    required_imgs = set(required_imgs)
+    for img in [img for img in manifest if img not in required_imgs]:
+        del manifest[img]
+
+    with open(manifest_path, 'w') as f:
+        print('Saving image manifest at file: ' + manifest_path)
+        json.dump({'images': dict(sorted(manifest.items()))}, f, ensure_ascii=False, indent=2)
+
+
+def fetch_image(img, dest_path, known_entry=None, optimized_entry=None):
+    """
+    Downloads a single image to dest_path. Returns a (status, content) tuple, where status is SAVED, UNCHANGED
+    (identical to the copy we already have, according to known_entry or else the file on disk) or FAILED. An image
+    missing from disk is always saved, whatever known_entry says.
+
+    If the image has been recompressed by optimize.py, optimized_entry is its entry in the optimization cache, which
+    maps the hash of the recompressed copy back to the hash of the wiki's copy it was made from.
+    """
+    r = wiki.get(wiki.WIKI_BASE + '/w/Special:Filepath/' + img)
+    if r.status_code != 200:
+        return FAILED, None
+
+    if os.path.isfile(dest_path):
+        sha256 = hashlib.sha256(r.content).hexdigest()
+        if known_entry is not None:
+            existing_sha256 = known_entry['sha256']
+        else:
+            with open(dest_path, 'rb') as f:
+                existing_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+        if existing_sha256 == sha256 or (
+                optimized_entry is not None
+                and optimized_entry['sha256'] == sha256
+                and optimized_entry.get('optimized_sha256') == existing_sha256):
+            return UNCHANGED, r.content
+
+    with open(dest_path, 'wb') as f:
+        f.write(r.content)
+    return SAVED, r.content
+
+
+def download_images(required_imgs, img_path, workers=DEFAULT_WORKERS, refresh=False, manifest=None, journal=None,
+                    optimized=None):
+    """
+    Fetches every image in required_imgs that isn't already present in img_path. If refresh is set, images that
+    already exist are re-checked against the wiki too (cheaply, when the response cache is enabled) and replaced
+    if they have changed.
+
+    If a manifest is given, an image only counts as existing if it's in the manifest as well as on disk, and the
+    manifest is updated in place with every image fetched.
+    If a checkpoint journal is given, images it says were already fetched by an earlier run are skipped, and every
+    image fetched is recorded in it.
+    If an image optimization cache is given (see optimize.py), images that were recompressed after being downloaded
+    still count as unchanged if the wiki's copy hasn't changed.
+    Returns a (saved, skipped, failed) tuple of counts.
+    """
+    def exists(img):
+        return (manifest is None or img in manifest) and os.path.isfile(img_path + img)
+
+    to_fetch = []
+    skipped = 0
+    for img in required_imgs:
+        if journal is not None and img in journal.images:
+            if manifest is not None:
+                manifest[img] = journal.images[img]
+            skipped += 1
+        elif not refresh and exists(img):
+            skipped += 1
+        else:
+            to_fetch.append(img)
+
+    saved = 0
+    failed = 0
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(fetch_image, img, img_path + img, manifest.get(img) if manifest is not None else None,
+                            optimized.get(img) if optimized is not None else None): img
+            for img in to_fetch
+        }
+        for future in as_completed(futures):
+            img = futures[future]
+            try:
+                result, content = future.result()
+            except (requests.RequestException, OSError) as e:
+                print(f'Unable to save image: {img} ({e})')
+                result, content = None, None
+
+            if content is not None:
+                entry = image_entry(content)
+                if manifest is not None:
+                    manifest[img] = entry
+                if journal is not None:
+                    journal.record_image(img, entry)
+
+            done += 1
+            if result == SAVED:
+                saved += 1
+                metrics.log(f'({done}/{len(to_fetch)}) Saved image: {img}')
+            elif result == UNCHANGED:
+                skipped += 1
+            else:
+                failed += 1
+                if result is not None:
+                    print(f'({done}/{len(to_fetch)}) Unable to save image: {img}')
+
+    return saved, skipped, failed
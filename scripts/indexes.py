@@ -0,0 +1,75 @@
+"""
+    Prebuilt lookup indexes for the generated JSON data files, so that clients can load them ready-made instead of
+    building them over every record at startup. An index file contains:
+    * `ids`: item/monster ID -> positions of its records in the data file
+    * `prefixes`: the first 1 to PREFIX_LENGTH characters of each word in the normalised `name version` -> positions
+    * `trigrams`: each three-character run of the normalised `name version` -> positions
+    * `slots`: equipment slot -> item IDs, if the records have slots
+
+    Position lists are in ascending order. Names are normalised with `normalise`: lower case, with anything other than
+    letters and digits collapsed to single spaces.
+
+    Written for Python 3.9.
+"""
+import json
+import re
+
+FORMAT_VERSION = 1
+PREFIX_LENGTH = 3
+
+_separator_regex = re.compile(r'[^0-9a-z]+')
+
+
+def normalise(text):
+    return _separator_regex.sub(' ', text.lower()).strip()
+
+
+def search_text(record):
+    return normalise(f"{record.get('name') or ''} {record.get('version') or ''}")
+
+
+def _add(index, key, pos):
+    positions = index.setdefault(key, [])
+    # Records are visited in order, so only the last position needs checking for duplicates
+    if not positions or positions[-1] != pos:
+        positions.append(pos)
+
+
+def build_index(records):
+    """Builds the index in a single pass over the records, which can be any iterable."""
+    count = 0
+    ids = {}
+    prefixes = {}
+    trigrams = {}
+    slots = {}
+
+    for pos, record in enumerate(records):
+        count += 1
+        _add(ids, str(record['id']), pos)
+
+        text = search_text(record)
+        for word in text.split():
+            for n in range(1, min(len(word), PREFIX_LENGTH) + 1):
+                _add(prefixes, word[:n], pos)
+        for i in range(len(text) - 2):
+            _add(trigrams, text[i:i + 3], pos)
+
+        if record.get('slot'):
+            slots.setdefault(record['slot'], []).append(record['id'])
+
+    index = {
+        'version': FORMAT_VERSION,
+        'count': count,
+        'ids': ids,
+        'prefixes': dict(sorted(prefixes.items())),
+        'trigrams': dict(sorted(trigrams.items())),
+    }
+    if slots:
+        index['slots'] = dict(sorted(slots.items()))
+    return index
+
+
+def write_index(records, path):
+    with open(path, 'w') as f:
+        print('Saving lookup index at file: ' + path)
+        json.dump(build_index(records), f, ensure_ascii=False, separators=(',', ':'))
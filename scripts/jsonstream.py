@@ -0,0 +1,147 @@
+"""
+    Streaming reads and writes for the JSON arrays in the generated data files, so that the generators can pass their
+    records straight through to disk instead of building the whole file in memory first:
+    * `dump` (or an `ArrayWriter`) writes records one at a time, laid out exactly as json.dump(records, f,
+      ensure_ascii=False, indent=2)
+    * `load` reads a JSON array file back one record at a time
+    * `sort` sorts records too many to hold at once, by sorting them in runs of RUN_SIZE, spilling all but the last
+      run to temporary files, and merging the runs back together
+
+    Example:
+        with open(path, 'w') as f:
+            jsonstream.dump(jsonstream.sort(records, key=lambda r: r['name']), f)
+
+    Written for Python 3.9.
+"""
+import heapq
+import json
+import os
+import tempfile
+
+# Number of records sorted in memory at a time
+RUN_SIZE = 2000
+
+# Number of characters read from a file at a time
+READ_SIZE = 64 * 1024
+
+
+class ArrayWriter:
+    """
+    Writes a JSON array to f one record at a time, laid out the same as json.dump(records, f, ensure_ascii=False,
+    indent=indent), or compactly if indent is None. close() finishes the array, but leaves f open.
+    """
+
+    def __init__(self, f, indent=2):
+        self.f = f
+        self.indent = indent
+        self.count = 0
+
+    def write(self, record):
+        if self.indent is None:
+            self.f.write('[' if self.count == 0 else ',')
+            self.f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        else:
+            pad = ' ' * self.indent
+            self.f.write(('[\n' if self.count == 0 else ',\n') + pad)
+            self.f.write(json.dumps(record, ensure_ascii=False, indent=self.indent).replace('\n', '\n' + pad))
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            self.f.write('[]')
+        else:
+            self.f.write(']' if self.indent is None else '\n]')
+
+
+def dump(records, f, indent=2):
+    """Writes the records to f as a JSON array, returning how many there were."""
+    writer = ArrayWriter(f, indent)
+    for r in records:
+        writer.write(r)
+    writer.close()
+    return writer.count
+
+
+def load(path):
+    """Yields the records of a file holding a JSON array, one at a time. Raises ValueError if it doesn't hold one."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = ''
+        eof = False
+
+        def more():
+            nonlocal buf, eof
+            chunk = f.read(READ_SIZE)
+            eof = not chunk
+            buf += chunk
+            return not eof
+
+        def next_char():
+            # Drops any whitespace from the start of the buffer, and returns the character after it ('' at the end)
+            nonlocal buf
+            while True:
+                buf = buf.lstrip()
+                if buf or not more():
+                    return buf[:1]
+
+        if next_char() != '[':
+            raise ValueError('Expected a JSON array in file: ' + path)
+        buf = buf[1:]
+        if next_char() == ']':
+            return
+
+        while True:
+            next_char()
+            while True:
+                try:
+                    record, end = decoder.raw_decode(buf)
+                except ValueError:
+                    if not more():
+                        raise
+                    continue
+                # A value that runs up to the end of the buffer may have been cut short (e.g. a number)
+                if end < len(buf) or not more():
+                    break
+            yield record
+
+            buf = buf[end:]
+            c = next_char()
+            if c == ']':
+                return
+            if c != ',':
+                raise ValueError('Expected , or ] in JSON array in file: ' + path)
+            buf = buf[1:]
+
+
+def _spill(run, tmp_dir, n):
+    path = os.path.join(tmp_dir, f'run{n}.jsonl')
+    with open(path, 'w') as f:
+        for r in run:
+            f.write(json.dumps(r, ensure_ascii=False) + '\n')
+    return path
+
+
+def _read_run(path):
+    with open(path, 'r') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def sort(records, key, run_size=RUN_SIZE):
+    """
+    Yields the records sorted by key. The sort is stable, like sorted(). Spilled records go through JSON, so records
+    should only hold JSON types.
+    """
+    with tempfile.TemporaryDirectory(prefix='jsonstream-') as tmp_dir:
+        spilled = []
+        run = []
+        for r in records:
+            run.append(r)
+            if len(run) >= run_size:
+                run.sort(key=key)
+                spilled.append(_spill(run, tmp_dir, len(spilled)))
+                run = []
+        run.sort(key=key)
+
+        # merge() takes equal records from earlier iterables first, so the runs need to be passed in input order
+        yield from heapq.merge(*[_read_run(p) for p in spilled], run, key=key)
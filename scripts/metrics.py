@@ -0,0 +1,187 @@
+"""
+    Lightweight instrumentation for the generator scripts. Records per-stage wall time, per-request latency, bytes
+    received (the decoded response bodies), retries and cache hits, and writes them out as a JSON report at the end of
+    a run.
+
+    Stage times are exclusive: time spent in a nested stage (e.g. waiting on a bucket fetch while transforming rows)
+    is only counted against the innermost stage.
+
+    With --memory-budget, memory allocations are traced with tracemalloc, the peak is added to the report, and the run
+    fails if the peak went over the budget. Tracing slows the transforms down, so it's off otherwise.
+
+    Written for Python 3.9.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds (in ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+quiet = False
+_report_path = None
+_memory_budget = None
+_started_at = time.time()
+_start = time.perf_counter()
+
+_lock = threading.Lock()
+_stages = defaultdict(float)
+_stage_stack = []
+_counters = defaultdict(int)
+_requests = defaultdict(lambda: {
+    'count': 0,
+    'bytes': 0,
+    'retries': 0,
+    'errors': 0,
+    'statuses': defaultdict(int),
+    'latencies': [],
+})
+
+
+def add_arguments(parser):
+    parser.add_argument('--quiet', action='store_true',
+                        help='only print summaries, not a line for every item')
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help='write a JSON report of stage timings and network usage to this file')
+    parser.add_argument('--memory-budget', metavar='MIB', type=float, default=None,
+                        help='fail the run if its peak memory allocated goes over this many MiB')
+
+
+def configure(args):
+    global quiet, _report_path, _memory_budget
+    quiet = args.quiet
+    _report_path = args.metrics
+    _memory_budget = args.memory_budget
+    if _memory_budget is not None:
+        tracemalloc.start()
+
+
+def log(message):
+    """Prints per-item progress, unless running in quiet mode."""
+    if not quiet:
+        print(message)
+
+
+@contextmanager
+def stage(name):
+    """Times a stage of the run. Only used from the main thread."""
+    start = time.perf_counter()
+    _stage_stack.append([name, 0.0])
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _, nested = _stage_stack.pop()
+        _stages[name] += elapsed - nested
+        if _stage_stack:
+            _stage_stack[-1][1] += elapsed
+
+
+def timed_iter(name, iterable):
+    """Wraps an iterable so that time spent waiting on each item is counted against the given stage."""
+    it = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] += n
+
+
+def request_kind(url):
+    return 'image' if '/Special:Filepath/' in url else 'api'
+
+
+def record_request(url, latency, status=None, size=0, error=False):
+    with _lock:
+        stats = _requests[request_kind(url)]
+        stats['count'] += 1
+        stats['bytes'] += size
+        stats['latencies'].append(latency)
+        if error:
+            stats['errors'] += 1
+        else:
+            stats['statuses'][str(status)] += 1
+
+
+def record_retry(url):
+    with _lock:
+        _requests[request_kind(url)]['retries'] += 1
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return {}
+
+    latencies = sorted(l * 1000 for l in latencies)
+    histogram = {f'<={b}': 0 for b in LATENCY_BUCKETS_MS}
+    histogram[f'>{LATENCY_BUCKETS_MS[-1]}'] = 0
+    for l in latencies:
+        bucket = next((f'<={b}' for b in LATENCY_BUCKETS_MS if l <= b), f'>{LATENCY_BUCKETS_MS[-1]}')
+        histogram[bucket] += 1
+
+    return {
+        'mean': round(sum(latencies) / len(latencies), 2),
+        'p50': round(latencies[len(latencies) // 2], 2),
+        'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        'max': round(latencies[-1], 2),
+        'histogram': histogram,
+    }
+
+
+def report():
+    """Builds the report for everything recorded so far."""
+    with _lock:
+        result = {
+            'script': os.path.basename(sys.argv[0]),
+            'started_at': _started_at,
+            'wall_time': round(time.perf_counter() - _start, 3),
+            'stages': {name: round(t, 3) for name, t in _stages.items()},
+            'requests': {
+                kind: {
+                    'count': stats['count'],
+                    'bytes': stats['bytes'],
+                    'retries': stats['retries'],
+                    'errors': stats['errors'],
+                    'statuses': dict(stats['statuses']),
+                    'latency_ms': _latency_summary(stats['latencies']),
+                }
+                for kind, stats in _requests.items()
+            },
+            'counters': dict(_counters),
+        }
+    if tracemalloc.is_tracing():
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+    return result
+
+
+def write_report():
+    """Writes the report to the file given with --metrics, if any, then checks the peak memory against its budget."""
+    if _report_path:
+        with open(_report_path, 'w') as f:
+            print('Saving metrics report at file: ' + _report_path)
+            json.dump(report(), f, indent=2)
+
+    check_memory_budget()
+
+
+def check_memory_budget():
+    """Exits with an error if the peak memory allocated so far is over the --memory-budget."""
+    if _memory_budget is None:
+        return
+
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    print(f'Peak memory allocated: {peak:.1f} MiB (budget: {_memory_budget:g} MiB)')
+    if peak > _memory_budget:
+        sys.exit(f'Peak memory allocated ({peak:.1f} MiB) is over the budget of {_memory_budget:g} MiB')
@@ -0,0 +1,225 @@
+"""
+    Image optimization stage for the generator scripts, run after the images have been downloaded. Across a pool of
+    worker processes, each image is:
+    * losslessly recompressed in place, if that makes it any smaller (the wiki's PNGs are usually well compressed
+      already, so this rarely wins)
+    * encoded in each of the variant formats, saved next to it as `<image>.<format>` (e.g. `Abyssal whip.png.webp`),
+      keeping only the variants that come out smaller than the image itself
+
+    WebP variants are lossless. Pillow only encodes AVIF lossily, so AVIF variants are made at full quality (with no
+    chroma subsampling), and are off by default; for the small palette icons here they're rarely smaller anyway.
+
+    Results are cached in a JSON file by each image's source SHA-256 (from the image manifest, see images.py), so an
+    image is only processed again if the wiki's copy changes, or the variant formats asked for do. The cache also
+    lists which variants exist, for the app to pick from, and the SHA-256 of the recompressed image, so that it can
+    still be matched up with the wiki's copy (see images.fetch_image).
+
+    Written for Python 3.9.
+"""
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, features
+
+import metrics
+from cache import write_atomic
+
+# Pillow save options for each variant format
+VARIANT_FORMATS = {
+    'webp': {'format': 'WEBP', 'lossless': True, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 100, 'subsampling': '4:4:4'},
+}
+DEFAULT_FORMATS = ['webp']
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def add_arguments(parser):
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='recompress the downloaded images and generate smaller variants of them (see optimize.py)')
+    parser.add_argument('--optimize-workers', type=int, default=DEFAULT_WORKERS,
+                        help='number of processes to optimize images with')
+    parser.add_argument('--image-formats', type=parse_formats, default=','.join(DEFAULT_FORMATS),
+                        help=f"comma-separated variant formats to generate, out of: {', '.join(VARIANT_FORMATS)}")
+
+
+def parse_formats(value):
+    """Parses --image-formats. Whether Pillow can encode them is only checked once images are optimized."""
+    formats = []
+    for fmt in filter(None, (f.strip().lower() for f in value.split(','))):
+        if fmt not in VARIANT_FORMATS:
+            raise ValueError(f'Unknown image format: {fmt}')
+        formats.append(fmt)
+    return sorted(formats)
+
+
+def supported_formats(formats):
+    """Drops any of the formats this build of Pillow can't encode."""
+    return [fmt for fmt in formats if features.check(fmt)]
+
+
+def variant_names(img):
+    """Lists the names that variants of an image could be saved under, in any format."""
+    return [f'{img}.{fmt}' for fmt in VARIANT_FORMATS]
+
+
+def is_variant(name):
+    return any(name.endswith('.' + fmt) for fmt in VARIANT_FORMATS)
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)['images']
+    except FileNotFoundError:
+        return {}
+
+
+def save_cache(cache, path, required_imgs):
+    """Writes the cache, first dropping any images that are no longer required from it."""
+    required_imgs = set(required_imgs)
+    for img in [img for img in cache if img not in required_imgs]:
+        del cache[img]
+
+    with open(path, 'w') as f:
+        print('Saving image variants at file: ' + path)
+        json.dump({'images': dict(sorted(cache.items()))}, f, ensure_ascii=False, indent=2)
+
+
+def _encode(im, **options):
+    buf = io.BytesIO()
+    im.save(buf, **options)
+    return buf.getvalue()
+
+
+def optimize_image(path, formats):
+    """
+    Optimizes the image at path, and writes its variants. Returns the size the image started and ended up as, the
+    SHA-256 it ended up with, and the sizes of the variants that were kept. Run in the worker processes.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    source_size = len(content)
+
+    variants = {}
+    with Image.open(io.BytesIO(content)) as im:
+        im.load()
+        # Leave animations alone, as only their first frame would survive
+        if not getattr(im, 'is_animated', False):
+            if im.format == 'PNG':
+                recompressed = _encode(im, format='PNG', optimize=True)
+                if len(recompressed) < len(content):
+                    write_atomic(path, recompressed)
+                    content = recompressed
+
+            # The variant formats only take RGB(A), and lose a PNG's transparent colour unless it's made into alpha
+            if im.mode not in ('RGB', 'RGBA') or 'transparency' in im.info:
+                has_alpha = 'A' in im.getbands() or 'transparency' in im.info
+                im = im.convert('RGBA' if has_alpha else 'RGB')
+
+            for fmt in formats:
+                variant = _encode(im, **VARIANT_FORMATS[fmt])
+                if len(variant) < len(content):
+                    write_atomic(f'{path}.{fmt}', variant)
+                    variants[fmt] = len(variant)
+
+    # Clear out any variants from earlier runs that weren't kept this time
+    for fmt in VARIANT_FORMATS:
+        if fmt not in variants and os.path.isfile(f'{path}.{fmt}'):
+            os.remove(f'{path}.{fmt}')
+
+    return source_size, len(content), hashlib.sha256(content).hexdigest(), variants
+
+
+def _is_cached(entry, source, img_path, img, formats):
+    # The size tells apart an image that's been downloaded again since it was recompressed
+    return (
+        entry is not None
+        and entry['sha256'] == source['sha256']
+        and entry['formats'] == formats
+        and os.path.isfile(img_path + img)
+        and os.path.getsize(img_path + img) == entry['bytes']
+        and all(os.path.isfile(f'{img_path}{img}.{fmt}') for fmt in entry['variants'])
+    )
+
+
+def optimize_images(required_imgs, img_path, manifest, cache, formats=DEFAULT_FORMATS, workers=DEFAULT_WORKERS):
+    """
+    Optimizes every image in required_imgs that's in the manifest (i.e. was downloaded), skipping those whose results
+    are already in the cache. The cache is updated in place.
+    Returns an (optimized, cached, failed) tuple of counts.
+    """
+    requested_formats = formats
+    formats = supported_formats(formats)
+
+    to_optimize = []
+    cached = 0
+    for img in required_imgs:
+        source = manifest.get(img)
+        if source is None:
+            continue
+        if _is_cached(cache.get(img), source, img_path, img, formats):
+            cached += 1
+        else:
+            to_optimize.append(img)
+
+    optimized = 0
+    failed = 0
+    if to_optimize:
+        for fmt in requested_formats:
+            if fmt not in formats:
+                print(f'[WARN] Pillow was built without {fmt} support, skipping {fmt} variants')
+
+        with ProcessPoolExecutor(max(1, workers)) as executor:
+            futures = {executor.submit(optimize_image, img_path + img, formats): img for img in to_optimize}
+            for future in as_completed(futures):
+                img = futures[future]
+                try:
+                    source_size, size, sha256, variants = future.result()
+                except (OSError, ValueError) as e:
+                    print(f'Unable to optimize image: {img} ({e})')
+                    failed += 1
+                    continue
+
+                # If only the formats changed, the image on disk may already have been recompressed by an earlier run
+                previous = cache.get(img)
+                if previous is not None and previous['sha256'] == manifest[img]['sha256']:
+                    source_size = previous['source_bytes']
+
+                cache[img] = {
+                    'sha256': manifest[img]['sha256'],
+                    'source_bytes': source_size,
+                    'bytes': size,
+                    'optimized_sha256': sha256,
+                    'formats': formats,
+                    'variants': variants,
+                }
+                optimized += 1
+                metrics.log(f'({optimized + failed}/{len(to_optimize)}) Optimized image: {img}')
+
+    return optimized, cached, failed
+
+
+def report(required_imgs, cache):
+    """Prints the bytes saved across all the required images, by recompression and by serving each variant format."""
+    source_bytes = 0
+    optimized_bytes = 0
+    variant_saved = {fmt: 0 for fmt in VARIANT_FORMATS}
+    for img in required_imgs:
+        entry = cache.get(img)
+        if entry is None:
+            continue
+        source_bytes += entry['source_bytes']
+        optimized_bytes += entry['bytes']
+        for fmt, size in entry['variants'].items():
+            variant_saved[fmt] += entry['bytes'] - size
+
+    recompression_saved = source_bytes - optimized_bytes
+    metrics.count('image_bytes_saved', recompression_saved)
+    print(f'Total image bytes saved by recompression: {recompression_saved} of {source_bytes}')
+    for fmt, saved in variant_saved.items():
+        if saved:
+            metrics.count(f'image_bytes_saved_{fmt}', saved)
+            print(f'Total image bytes saved by serving {fmt}: {saved} of {optimized_bytes}')
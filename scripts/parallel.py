@@ -0,0 +1,34 @@
+"""
+    Ordered, bounded parallel map over a pool of worker processes, for the transforms that can be split into chunks.
+    Tasks are submitted as the input produces them, and only a couple per worker are kept in flight, so that neither
+    the input nor the results pile up in memory ahead of the consumer.
+
+    Example:
+        for result in parallel.imap(convert_chunk, chunks, workers=4):
+            ...
+
+    Written for Python 3.9.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Number of tasks kept in flight per worker
+WINDOW = 2
+
+
+def imap(fn, items, workers, initializer=None, initargs=()):
+    """
+    Yields fn(item) for each of items, in order, running them across a pool of `workers` processes. fn must be
+    picklable, i.e. a module-level function.
+    """
+    executor = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    in_flight = deque()
+    try:
+        for item in items:
+            in_flight.append(executor.submit(fn, item))
+            if len(in_flight) >= workers * WINDOW:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
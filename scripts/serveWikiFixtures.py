@@ -0,0 +1,57 @@
+"""
+    Serves a directory recorded with `--record` as a local stand-in for the wiki, so that the generator scripts can
+    be pointed at it with `--wiki-base`.
+    Example:
+        python3 serveWikiFixtures.py fixtures/ --port 8080
+        python3 generateMonsters.py --wiki-base http://localhost:8080
+
+    Written for Python 3.9.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fixtures import FixtureStore
+
+
+def make_handler(store):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            fixture = store.lookup(self.path)
+            if fixture is None:
+                print('No recorded response for: ' + self.path)
+                status, content_type, body = 404, 'text/plain', b'No recorded response'
+            else:
+                status, content_type, body = fixture
+
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('fixtures', help='directory previously recorded with --record')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FixtureStore(args.fixtures)))
+    print(f'Serving {args.fixtures} at http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+    Sharded copies of the generated JSON data files, so that the app can load only the records it needs rather than
+    the whole file. The records are split up by a shard key (e.g. equipment by slot) into one compact JSON file per
+    shard, with a manifest listing every record's ID, name and version and the shard it's in:
+
+        {
+          "version": 1,
+          "count": 5329,
+          "shards": [{"key": "ammo", "file": "equipment/ammo.json", "count": 214}, ...],
+          "ids": [...],
+          "names": [...],
+          "versions": [...],
+          "shard": [...]
+        }
+
+    `shard` holds each record's position in `shards`, and shard files are given relative to the manifest. Records are
+    listed in the manifest in the same order as in the data file, and keep that order within their shard.
+
+    Written for Python 3.9.
+"""
+import contextlib
+import json
+import os
+
+import cache
+import indexes
+import jsonstream
+
+FORMAT_VERSION = 1
+
+
+def name_bucket(record):
+    """Shard key grouping records by the first character of their normalised name."""
+    first = indexes.normalise(record.get('name') or '')[:1]
+    if not first:
+        return '_'
+    return '0-9' if first.isdigit() else first
+
+
+def shards_missing(manifest_path):
+    """Checks whether the manifest, or any of the shard files it lists, is missing (or unreadable)."""
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return True
+
+    manifest_dir = os.path.dirname(manifest_path)
+    return any(not os.path.isfile(os.path.join(manifest_dir, shard['file'])) for shard in manifest['shards'])
+
+
+def write_shards(records, shard_key, shard_path, manifest_path):
+    """
+    Writes the records (any iterable) out to a file per shard in shard_path, followed by the manifest. Any other
+    shard files left in shard_path by earlier runs are removed.
+
+    Each file is written atomically (see cache.open_atomic), so a run that fails part way through leaves the shards
+    from the last run as they were, rather than truncated ones.
+    """
+    os.makedirs(shard_path, exist_ok=True)
+    manifest_dir = os.path.dirname(manifest_path)
+
+    paths = {}
+    writers = {}
+    ids = []
+    names = []
+    versions = []
+    record_shards = []
+    with contextlib.ExitStack() as stack:
+        for r in records:
+            key = shard_key(r)
+            if key not in writers:
+                paths[key] = os.path.join(shard_path, key + '.json')
+                writers[key] = jsonstream.ArrayWriter(stack.enter_context(cache.open_atomic(paths[key])), indent=None)
+            writers[key].write(r)
+
+            ids.append(r.get('id'))
+            names.append(r.get('name'))
+            versions.append(r.get('version') or '')
+            record_shards.append(key)
+
+        for writer in writers.values():
+            writer.close()
+
+    # Also clear out any temporary files left by a run that was killed part way through
+    for file in os.listdir(shard_path):
+        if (file.endswith('.json') and file[:-len('.json')] not in writers) or file.endswith('.tmp'):
+            os.remove(os.path.join(shard_path, file))
+
+    keys = sorted(writers)
+    positions = {key: i for i, key in enumerate(keys)}
+    shards = [{
+        'key': key,
+        'file': os.path.relpath(paths[key], manifest_dir).replace(os.sep, '/'),
+        'count': writers[key].count,
+    } for key in keys]
+
+    with cache.open_atomic(manifest_path) as f:
+        print(f'Saving {len(shards)} shards in: {shard_path}, with manifest at file: {manifest_path}')
+        json.dump({
+            'version': FORMAT_VERSION,
+            'count': len(ids),
+            'shards': shards,
+            'ids': ids,
+            'names': names,
+            'versions': versions,
+            'shard': [positions[key] for key in record_shards],
+        }, f, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,74 @@
+"""
+    Packs the images listed in an image manifest into a few sprite atlases, so that clients can fetch a handful of
+    atlases instead of thousands of individual files. Images are laid out in shelves (rows), tallest first, using the
+    dimensions recorded in the manifest. Only icon-sized images are packed; anything larger than MAX_SPRITE_SIZE is
+    left out and served on its own.
+
+    The index maps each image's file name to [atlas number, x, y, width, height].
+
+    Written for Python 3.9.
+"""
+import json
+import os
+
+from PIL import Image
+
+ATLAS_SIZE = 2048
+MAX_SPRITE_SIZE = 64
+
+
+def pack(manifest, max_size=ATLAS_SIZE, max_sprite_size=MAX_SPRITE_SIZE):
+    """Lays out the manifest's images into atlases, returning {image: (atlas, x, y, width, height)}."""
+    max_sprite_size = min(max_sprite_size, max_size)
+    sizes = [
+        (img, entry['width'], entry['height']) for img, entry in manifest.items()
+        if entry['width'] and entry['height'] and entry['width'] <= max_sprite_size and entry['height'] <= max_sprite_size
+    ]
+    sizes.sort(key=lambda s: (-s[2], -s[1], s[0]))
+
+    placements = {}
+    atlas, x, y, shelf_height = 0, 0, 0, 0
+    for img, width, height in sizes:
+        if x + width > max_size:
+            # Start a new shelf below the current one
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + height > max_size:
+            # Out of room, start a new atlas
+            atlas, x, y, shelf_height = atlas + 1, 0, 0, 0
+
+        placements[img] = (atlas, x, y, width, height)
+        x += width
+        shelf_height = max(shelf_height, height)
+
+    return placements
+
+
+def build_atlases(manifest, img_path, atlas_path, prefix, index_file_name, max_size=ATLAS_SIZE,
+                  max_sprite_size=MAX_SPRITE_SIZE):
+    """Packs the manifest's images into PNG atlases at atlas_path, and writes the sprite index to index_file_name."""
+    placements = pack(manifest, max_size, max_sprite_size)
+    atlas_count = max((p[0] for p in placements.values()), default=-1) + 1
+
+    os.makedirs(atlas_path, exist_ok=True)
+    atlas_files = []
+    for atlas in range(atlas_count):
+        members = [(img, p) for img, p in placements.items() if p[0] == atlas]
+        width = max(p[1] + p[3] for _, p in members)
+        height = max(p[2] + p[4] for _, p in members)
+
+        sheet = Image.new('RGBA', (width, height))
+        for img, (_, x, y, _, _) in members:
+            with Image.open(img_path + img) as im:
+                sheet.paste(im.convert('RGBA'), (x, y))
+
+        file_name = f'{prefix}-{atlas}.png'
+        sheet.save(os.path.join(atlas_path, file_name), optimize=True)
+        atlas_files.append(file_name)
+        print(f'Saved atlas: {file_name} ({len(members)} images)')
+
+    with open(index_file_name, 'w') as f:
+        print('Saving atlas index at file: ' + index_file_name)
+        json.dump({
+            'atlases': atlas_files,
+            'sprites': {img: list(p) for img, p in sorted(placements.items())},
+        }, f, ensure_ascii=False, indent=2)
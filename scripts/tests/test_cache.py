@@ -0,0 +1,55 @@
+"""
+    Tests for pruning the on-disk response cache. Run from the scripts directory with: python -m unittest discover tests
+
+    Written for Python 3.9.
+"""
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+
+from cache import ResponseCache, write_atomic
+
+URL = 'https://oldschool.runescape.wiki/w/Special:Filepath/Abyssal_whip.png'
+
+
+def make_response(content):
+    r = requests.Response()
+    r.status_code = 200
+    r.url = URL
+    r._content = content
+    return r
+
+
+class PruneTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache = ResponseCache(tmp_dir.name)
+
+    def test_replaced_body_is_removed(self):
+        self.cache.store(URL, make_response(b'old'))
+        entry = self.cache.store(URL, make_response(b'new'))
+
+        self.assertEqual(self.cache.prune()[1], 1)
+        self.assertEqual(self.cache.response(self.cache.lookup(URL)).content, b'new')
+        self.assertEqual(os.listdir(os.path.dirname(self.cache._object_path(entry['content_hash']))),
+                         [entry['content_hash']])
+
+    def test_unused_entry_is_removed(self):
+        entry = self.cache.store(URL, make_response(b'old'))
+        entry['fetched_at'] = time.time() - 60
+        write_atomic(self.cache._entry_path(URL), json.dumps(entry).encode('utf-8'))
+
+        self.assertEqual(self.cache.prune(max_age=3600)[:2], (0, 0))
+        self.assertIsNotNone(self.cache.lookup(URL))
+
+        self.assertEqual(self.cache.prune(max_age=30)[:2], (1, 1))
+        self.assertIsNone(self.cache.lookup(URL))
+
+
+if __name__ == '__main__':
+    unittest.main()
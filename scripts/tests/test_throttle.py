@@ -0,0 +1,35 @@
+"""
+    Tests for the adaptive concurrency limit. Run from the scripts directory with: python -m unittest discover tests
+
+    Written for Python 3.9.
+"""
+import unittest
+
+from throttle import Scheduler
+
+
+class ConcurrencyLimitTest(unittest.TestCase):
+    def test_serial_requests_dont_grow_the_limit(self):
+        scheduler = Scheduler(max_rate=1000, max_concurrency=16, initial_concurrency=2)
+        for _ in range(100):
+            at_limit = scheduler.acquire()
+            scheduler.release('api', 0.01, at_limit=at_limit)
+        self.assertEqual(scheduler.limit, 2)
+
+    def test_requests_at_the_limit_grow_it_up_to_the_maximum(self):
+        scheduler = Scheduler(max_rate=1000, max_concurrency=4, initial_concurrency=2)
+        for _ in range(100):
+            slots = [scheduler.acquire() for _ in range(int(scheduler.limit))]
+            for at_limit in slots:
+                scheduler.release('api', 0.01, at_limit=at_limit)
+        self.assertEqual(scheduler.limit, 4)
+
+    def test_throttling_halves_the_limit(self):
+        scheduler = Scheduler(max_rate=1000, max_concurrency=16, initial_concurrency=8)
+        at_limit = scheduler.acquire()
+        scheduler.release('api', 0.01, throttled=True, at_limit=at_limit)
+        self.assertEqual(scheduler.limit, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+    Tests for the wiki response cache. Run from the scripts directory with: python -m unittest discover tests
+
+    Written for Python 3.9.
+"""
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import wiki
+from cache import ResponseCache
+
+URL = 'https://oldschool.runescape.wiki/api.php?action=bucket'
+
+
+def make_response(body, headers=None):
+    r = requests.Response()
+    r.status_code = 200
+    r.url = URL
+    r._content = json.dumps(body).encode('utf-8')
+    r.headers['Content-Type'] = 'application/json; charset=utf-8'
+    r.headers.update(headers or {})
+    return r
+
+
+class CachedGetTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = mock.patch.object(wiki, '_cache', ResponseCache(tmp_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch_twice(self, response):
+        """Fetches URL twice with the network returning response, and returns how many times the network was hit."""
+        session = mock.Mock()
+        session.get.return_value = response
+        with mock.patch.object(wiki, 'get_session', return_value=session):
+            wiki.get(URL, retries=0)
+            wiki.get(URL, retries=0)
+        return session.get.call_count
+
+    def test_success_is_replayed(self):
+        self.assertEqual(self.fetch_twice(make_response({'bucket': []})), 1)
+
+    def test_bucket_error_is_not_replayed(self):
+        self.assertEqual(self.fetch_twice(make_response({'error': 'Bucket query failed'})), 2)
+
+    def test_maxlag_is_not_replayed(self):
+        response = make_response({'error': {'code': 'maxlag'}}, {'MediaWiki-API-Error': 'maxlag'})
+        self.assertEqual(self.fetch_twice(response), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
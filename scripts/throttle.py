@@ -0,0 +1,100 @@
+"""
+    Adaptive rate limiting for wiki requests. Every request goes through a single Scheduler, which combines:
+    * a token bucket, capping the overall request rate (with bursts of up to a second's worth of requests)
+    * an AIMD concurrency limit: each healthy response adds 1/limit to the limit, so it grows by about one per
+      round of requests, while a throttling response (429/503, a maxlag error or a Retry-After) halves it. The limit
+      only grows from requests that were started with every slot in use, as the others didn't test it, and never
+      past max_concurrency
+    * a pause after any Retry-After, during which no new requests are started
+
+    A response counts as healthy when its latency is within HEALTHY_LATENCY_FACTOR of the fastest seen so far for
+    that kind of request, so that a slowing wiki stops the limit from growing before it starts refusing requests.
+
+    Written for Python 3.9.
+"""
+import threading
+import time
+
+import metrics
+
+DEFAULT_MAX_RATE = 50.0
+INITIAL_CONCURRENCY = 2
+MIN_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+HEALTHY_LATENCY_FACTOR = 2.0
+
+# Only back off once per this many seconds, so that a burst of throttled responses to requests that were already in
+# flight doesn't collapse the limit
+DECREASE_COOLDOWN = 1.0
+
+# Longest a request waits to be started before giving up, so that a slot that's never released fails the run instead
+# of hanging it
+ACQUIRE_TIMEOUT = 600.0
+
+
+class Scheduler:
+    def __init__(self, max_rate=DEFAULT_MAX_RATE, max_concurrency=16, initial_concurrency=INITIAL_CONCURRENCY):
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(MIN_CONCURRENCY, min(initial_concurrency, max_concurrency)))
+        self.in_flight = 0
+
+        self._capacity = max(1.0, max_rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._fastest = {}
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self.max_rate)
+        self._updated = now
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """
+        Blocks until a request may be started. Raises TimeoutError if that takes longer than timeout seconds.
+        Returns whether the request took up the last free slot, to be passed back to release().
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self.in_flight < int(self.limit) and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.in_flight += 1
+                    return self.in_flight >= int(self.limit)
+
+                if now >= deadline:
+                    raise TimeoutError(f'Waited over {timeout:g}s to start a request ({self.in_flight} in flight)')
+                if now < self._paused_until:
+                    self._cond.wait(min(self._paused_until, deadline) - now)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait(deadline - now)
+                else:
+                    self._cond.wait(min((1 - self._tokens) / self.max_rate, deadline - now))
+
+    def release(self, kind, latency=None, throttled=False, retry_after=None, at_limit=False):
+        """
+        Records the outcome of a request started with acquire(), passing back what acquire() returned as at_limit.
+        Requests that failed without a response should be released with no latency, which leaves the limit as it is.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if throttled:
+                metrics.count('throttled_responses')
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self.limit = max(MIN_CONCURRENCY, self.limit * DECREASE_FACTOR)
+                    self._last_decrease = now
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            elif latency is not None:
+                fastest = min(self._fastest.get(kind, latency), latency)
+                self._fastest[kind] = fastest
+                if at_limit and latency <= fastest * HEALTHY_LATENCY_FACTOR:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+            self._cond.notify_all()
@@ -0,0 +1,212 @@
+"""
+    Shared helpers for talking to the OSRS Wiki from the generator scripts.
+
+    Written for Python 3.9.
+"""
+import email.utils
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import DEFAULT_MAX_AGE, DEFAULT_TTL, ResponseCache
+from fixtures import FixtureStore
+from throttle import DEFAULT_MAX_RATE, Scheduler
+import metrics
+
+WIKI_BASE = 'https://oldschool.runescape.wiki'
+API_BASE = WIKI_BASE + '/api.php'
+USER_AGENT = 'osrs-dps-calc (https://github.com/weirdgloop/osrs-dps-calc)'
+
+# Upper bound on how many keep-alive connections we hold open to the wiki at once
+POOL_SIZE = 16
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 5
+BACKOFF_BASE = 1.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Responses that mean the wiki wants us to slow down
+THROTTLE_STATUSES = {429, 503}
+
+# If set, API requests ask the wiki to refuse them while its database replication lag is above this many seconds
+MAXLAG = None
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_recorder = None
+_replay = None
+_scheduler = Scheduler(DEFAULT_MAX_RATE, POOL_SIZE)
+
+
+def get_session():
+    """Returns a process-wide requests.Session, so that every request re-uses pooled keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update({
+                'User-Agent': USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate',
+            })
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def add_arguments(parser):
+    """Adds the command line options shared by every script that talks to the wiki."""
+    parser.add_argument('--wiki-base', default=WIKI_BASE,
+                        help='base URL of the wiki, e.g. a local serveWikiFixtures.py stand-in')
+    parser.add_argument('--cache-dir', default=None,
+                        help='cache wiki responses in this directory, revalidating them once they expire')
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_TTL,
+                        help='seconds a cached response is used without revalidating it')
+    parser.add_argument('--prune-cache', action='store_true',
+                        help='before running, remove cached responses that are no longer used from --cache-dir')
+    parser.add_argument('--cache-max-age', type=int, default=DEFAULT_MAX_AGE,
+                        help='with --prune-cache, seconds a cached response is kept for after it was last used')
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                        help='maximum number of requests per second to send to the wiki')
+    parser.add_argument('--max-concurrency', type=int, default=POOL_SIZE,
+                        help='maximum number of requests in flight at once; the actual limit adapts to how the wiki '
+                             'is responding')
+    parser.add_argument('--maxlag', type=int, default=None,
+                        help='ask the wiki to refuse API requests while its replication lag is above this many '
+                             'seconds, and wait for it to recover')
+    fixtures = parser.add_mutually_exclusive_group()
+    fixtures.add_argument('--record', metavar='DIR', default=None,
+                          help='record every wiki response into this fixture directory')
+    fixtures.add_argument('--replay', metavar='DIR', default=None,
+                          help='serve every wiki request from this fixture directory instead of the network')
+
+
+def configure(args):
+    """Applies the options added by add_arguments."""
+    global WIKI_BASE, API_BASE, MAXLAG, _cache, _recorder, _replay, _scheduler
+    WIKI_BASE = args.wiki_base.rstrip('/')
+    API_BASE = WIKI_BASE + '/api.php'
+    _cache = ResponseCache(args.cache_dir, args.cache_ttl) if args.cache_dir else None
+    if _cache is not None and args.prune_cache:
+        entries, objects, freed = _cache.prune(args.cache_max_age)
+        print(f'Pruned {entries} cached responses and {objects} unused bodies ({freed} bytes) from: {args.cache_dir}')
+    _recorder = FixtureStore(args.record) if args.record else None
+    _replay = FixtureStore(args.replay) if args.replay else None
+    MAXLAG = args.maxlag
+    _scheduler = Scheduler(args.max_rate, min(args.max_concurrency, POOL_SIZE))
+
+
+def fixture_key(url):
+    """The key a response is recorded under: its URL relative to the wiki base, so fixtures work against any host."""
+    return url[len(WIKI_BASE):] if url.startswith(WIKI_BASE) else url
+
+
+def get(url, params=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+    """
+    Performs a GET request against the wiki, retrying with exponential backoff on connection errors,
+    timeouts, 429s and 5xx responses. Other responses (including 404s) are returned as-is.
+
+    If a cache is configured, fresh entries are served from disk and stale ones are revalidated with
+    If-None-Match/If-Modified-Since, so unchanged resources cost a 304 rather than a full download.
+
+    Requests that do go to the network are paced by the adaptive scheduler in throttle.py.
+
+    In replay mode no network requests are made at all; responses come from the fixture directory.
+    """
+    if MAXLAG is not None and url == API_BASE:
+        params = dict(params or {}, maxlag=MAXLAG)
+    url = requests.Request('GET', url, params=params).prepare().url
+    if _replay is not None:
+        metrics.count('replayed_responses')
+        return _replay.load(fixture_key(url))
+
+    r = _cached_get(url, timeout, retries)
+    if _recorder is not None:
+        _recorder.save(fixture_key(url), r)
+    return r
+
+
+def _cached_get(url, timeout, retries):
+    if _cache is None:
+        return _get(url, None, None, timeout, retries)
+
+    entry = _cache.lookup(url)
+    if entry is not None and _cache.is_fresh(entry):
+        metrics.count('cache_hits')
+        return _cache.response(entry)
+
+    r = _get(url, None, _cache.conditional_headers(entry) if entry else None, timeout, retries)
+    if r.status_code == 304 and entry is not None:
+        metrics.count('cache_revalidated')
+        _cache.touch(entry)
+        return _cache.response(entry)
+    if _is_cacheable(r):
+        _cache.store(url, r)
+    return r
+
+
+def _is_cacheable(r):
+    """
+    Whether a response can be cached. API errors (including maxlag and Bucket query errors) come back as a 200 with an
+    `error` key, and often pass on their own, so they mustn't be replayed from the cache.
+    """
+    if r.status_code != 200 or 'MediaWiki-API-Error' in r.headers:
+        return False
+    if 'json' not in (r.headers.get('Content-Type') or ''):
+        return True
+    try:
+        data = r.json()
+    except ValueError:
+        return False
+    return not (isinstance(data, dict) and 'error' in data)
+
+
+def _retry_after(r):
+    """Returns the number of seconds a response's Retry-After header asks us to wait, if any."""
+    value = r.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _get(url, params, headers, timeout, retries):
+    kind = metrics.request_kind(url)
+    attempt = 0
+    while True:
+        retry_after = None
+        at_limit = _scheduler.acquire()
+        start = time.perf_counter()
+        try:
+            r = get_session().get(url, params=params, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            # Any failure without a response still has to give back its slot, or later requests would wait on it
+            _scheduler.release(kind)
+            metrics.record_request(url, time.perf_counter() - start, error=True)
+            if not isinstance(e, (requests.ConnectionError, requests.Timeout)) or attempt >= retries:
+                raise
+            reason = type(e).__name__
+        else:
+            latency = time.perf_counter() - start
+            retry_after = _retry_after(r)
+            maxlag = r.headers.get('MediaWiki-API-Error') == 'maxlag'
+            throttled = r.status_code in THROTTLE_STATUSES or maxlag or retry_after is not None
+            _scheduler.release(kind, latency, throttled, retry_after, at_limit)
+            metrics.record_request(url, latency, r.status_code, len(r.content))
+            if (r.status_code not in RETRY_STATUSES and not maxlag) or attempt >= retries:
+                return r
+            reason = 'maxlag' if maxlag else f'HTTP {r.status_code}'
+
+        metrics.record_retry(url)
+        delay = max(BACKOFF_BASE * (2 ** attempt), retry_after or 0)
+        attempt += 1
+        print(f'[WARN] {reason} from {url}, retrying in {delay:.0f}s ({attempt}/{retries})')
+        time.sleep(delay)